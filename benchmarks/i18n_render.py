@@ -0,0 +1,130 @@
+"""
+Micro-benchmark: text rendering cost of one screen, legacy get_text vs compiled catalog.
+
+Renders the master profile screen and a 5-item order history page the way
+handlers/client.py does, for every language.
+
+Usage:
+    python benchmarks/i18n_render.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEFAULT_LANGUAGE, SUPPORTED_LANGUAGES
+from utils import i18n
+from utils.i18n import MESSAGES
+
+
+# ====== Legacy implementation (before the compiled catalog) ======
+def legacy_get_text(key: str, language: str = DEFAULT_LANGUAGE, **kwargs) -> str:
+    if language not in SUPPORTED_LANGUAGES:
+        language = DEFAULT_LANGUAGE
+
+    text = MESSAGES.get(language, {}).get(key, f"[{key}]")
+
+    if kwargs:
+        try:
+            text = text.format(**kwargs)
+        except KeyError as e:
+            text = f"{text}\n[Missing key: {e}]"
+
+    return text
+
+def legacy_get_category_name(category_key: str, language: str = DEFAULT_LANGUAGE) -> str:
+    return legacy_get_text(f"category_{category_key}", language)
+
+def legacy_get_district_name(district_key: str, language: str = DEFAULT_LANGUAGE) -> str:
+    return legacy_get_text(f"district_{district_key}", language)
+
+
+# ====== Screens ======
+def _sample_keys(prefix: str, count: int) -> list:
+    """First names from the default catalog, without the prefix used by get_*_name"""
+    keys = [k.split("_", 1)[1] for k in MESSAGES[DEFAULT_LANGUAGE] if k.startswith(prefix) and not k.endswith("_short")]
+    return keys[:count]
+
+CATEGORY_KEYS = _sample_keys("category_v2_", 3)
+DISTRICT_KEYS = _sample_keys("district_", 3)
+
+def render_profile(get_text, get_category_name, get_district_name, lang: str) -> str:
+    text = f"🔧 <b>{get_text('menu_master_profile', lang)}:</b>\n\n"
+    text += f"<b>{get_text('field_name', lang)}:</b> Ivan\n"
+    text += f"<b>{get_text('field_phone', lang)}:</b> +905551112233\n"
+    text += f"<b>{get_text('field_status', lang)}:</b> {get_text('status_active_free', lang)}\n"
+    categories = ", ".join(get_category_name(k, lang) for k in CATEGORY_KEYS)
+    districts = ", ".join(get_district_name(k, lang) for k in DISTRICT_KEYS)
+    text += f"<b>{get_text('field_categories', lang)}:</b> {categories}\n"
+    text += f"<b>{get_text('field_districts', lang)}:</b> {districts}\n"
+    text += f"<b>{get_text('field_description', lang)}:</b> -\n"
+    text += f"\n✅ 12 {get_text('field_orders_count', lang)}"
+    text += f"\n{get_text('satisfied_clients_text', lang, percent=92)}"
+    return text
+
+def render_history(get_text, get_category_name, get_district_name, lang: str) -> str:
+    text = get_text("orders_history_title", lang) + "\n\n"
+    for i in range(5):
+        item = get_text("order_item_completed", lang,
+            date="2025-01-0%d" % (i + 1), time_str="12:00:00",
+            category=get_category_name(CATEGORY_KEYS[i % len(CATEGORY_KEYS)], lang),
+            master_name="Master %d" % i, rating=5)
+        text += f"{item}\n──────────────────\n"
+    text += get_text("btn_back", lang)
+    return text
+
+SCREENS = {
+    "profile": render_profile,
+    "history": render_history,
+}
+
+IMPLEMENTATIONS = {
+    "legacy": (legacy_get_text, legacy_get_category_name, legacy_get_district_name),
+    "compiled": (i18n.get_text, i18n.get_category_name, i18n.get_district_name),
+}
+
+
+def check_equivalence():
+    """Every catalog entry renders identically with both implementations"""
+    sample_kwargs = {}
+    for lang in SUPPORTED_LANGUAGES:
+        for key, text in MESSAGES.get(lang, {}).items():
+            for _, field, _, _ in i18n._formatter.parse(text):
+                if field:
+                    sample_kwargs[field] = f"<{field}>"
+
+    mismatches = 0
+    for lang in SUPPORTED_LANGUAGES + ["xx"]:
+        for key in MESSAGES.get(lang, MESSAGES[DEFAULT_LANGUAGE]):
+            for kwargs in ({}, sample_kwargs, {"unused": 1}):
+                if legacy_get_text(key, lang, **kwargs) != i18n.get_text(key, lang, **kwargs):
+                    mismatches += 1
+        for screen in SCREENS.values():
+            if screen(*IMPLEMENTATIONS["legacy"], lang) != screen(*IMPLEMENTATIONS["compiled"], lang):
+                mismatches += 1
+    return mismatches
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    mismatches = check_equivalence()
+    print(f"Equivalence check: {'OK' if not mismatches else f'{mismatches} mismatches'}")
+
+    for screen_name, screen in SCREENS.items():
+        results = {}
+        for impl_name, impl in IMPLEMENTATIONS.items():
+            def run():
+                for lang in SUPPORTED_LANGUAGES:
+                    screen(*impl, lang)
+            seconds = min(timeit.repeat(run, number=iterations, repeat=3))
+            results[impl_name] = seconds / (iterations * len(SUPPORTED_LANGUAGES)) * 1e6
+        speedup = results["legacy"] / results["compiled"]
+        print(f"{screen_name:8s} legacy {results['legacy']:7.2f} µs/screen | "
+              f"compiled {results['compiled']:7.2f} µs/screen | x{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    main()
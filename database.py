@@ -1,93 +1,264 @@
 import asyncpg
-import os
+import asyncio
+import contextvars
 import logging
 import datetime
 import time
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any
-from utils.phone_utils import normalize_phone, get_phone_search_variants
+from config import DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, USE_SEARCH_INDEX, MIGRATION_LOCK_TIMEOUT, MIGRATION_WAIT_TIMEOUT, QUERY_STATS, SLOW_QUERY_MS
+from utils.phone_utils import normalize_phone, to_e164
+from utils.query_stats import QueryStats
 
 log = logging.getLogger(__name__)
 
+# Migration that backfills masters.phone_e164; duplicates are reported once, when it applies
+PHONE_E164_BACKFILL_VERSION = 11
+
+# pg_try_advisory_xact_lock key for the premium expiry leader ("mersinpx")
+PREMIUM_EXPIRY_LOCK_KEY = 0x6D657273696E7078
+
+# Per-update scope (set by DbScopeMiddleware, see middlewares/db_scope.py)
+_request_scope: contextvars.ContextVar[Optional["RequestScope"]] = contextvars.ContextVar("db_request_scope", default=None)
+
+
+def _is_read_query(query: str) -> bool:
+    return query.lstrip().upper().startswith("SELECT")
+
+
+def _memo_key(method: str, query: str, args: tuple):
+    """Hashable key for a read query; None if args can't be hashed"""
+    key_args = tuple(tuple(a) if isinstance(a, list) else a for a in args)
+    try:
+        hash(key_args)
+    except TypeError:
+        return None
+    return (method, query, key_args)
+
+
+def _order_counters(rating) -> tuple:
+    """(completed, rated, satisfied) contribution of one completed order"""
+    return (1, int(rating is not None), int(rating is not None and rating >= 4))
+
+
+class RequestScope:
+    """
+    State bound to one Telegram update:
+    - a pooled connection, acquired lazily on first query and handed back as soon
+      as the handler goes idle (e.g. awaits the Bot API), so slow Telegram calls
+      don't pin pool connections; back-to-back queries still share one
+    - memo of identical read queries (cleared on any write), kept across connections
+    """
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.conn = None
+        # One asyncpg connection can't run queries concurrently
+        self.lock = asyncio.Lock()
+        self.memo: Dict[Any, Any] = {}
+        self.closed = False
+        # Statements actually sent to Postgres (memo hits excluded)
+        self.queries = 0
+        self._idle_handle: Optional[asyncio.Handle] = None
+        self._idle_task: Optional[asyncio.Task] = None
+
+    async def get_conn(self):
+        """Call with self.lock held"""
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self.conn is None:
+            self.conn = await self.pool.acquire()
+        return self.conn
+
+    def idle(self):
+        """
+        Statement (or connection() block) finished: release the connection on the
+        next loop iteration unless another query picks it up first. A handler that
+        continues with another query reuses it; one that awaits I/O gives it back.
+        """
+        if self.conn is None or self.closed or self._idle_handle is not None:
+            return
+        self._idle_handle = asyncio.get_running_loop().call_soon(self._schedule_idle_release)
+
+    def _schedule_idle_release(self):
+        self._idle_handle = None
+        # Keep a reference so the task isn't garbage-collected mid-release
+        self._idle_task = asyncio.create_task(self._release_idle())
+
+    async def _release_idle(self):
+        # Under the lock: never while a statement or transaction is using the connection
+        async with self.lock:
+            if self.conn is None or self._idle_handle is not None:
+                return
+            conn, self.conn = self.conn, None
+            await self.pool.release(conn)
+
+    async def release(self):
+        self.closed = True
+        self.memo.clear()
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            await self.pool.release(conn)
+
+
+class InstrumentedConnection:
+    """
+    Connection yielded by Database.connection(): fetch*/execute go through
+    Database._call (query_stats) and count towards the request scope's queries.
+    Everything else (transaction(), ...) is the underlying asyncpg connection's.
+    """
+
+    def __init__(self, db: "Database", conn, scope: Optional[RequestScope] = None):
+        self._db = db
+        self._conn = conn
+        self._scope = scope
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def _run(self, method: str, query: str, args: tuple):
+        if self._scope is not None:
+            self._scope.queries += 1
+        return await self._db._call(self._conn, method, query, args)
+
+    async def fetchrow(self, query: str, *args):
+        return await self._run("fetchrow", query, args)
+
+    async def fetch(self, query: str, *args):
+        return await self._run("fetch", query, args)
+
+    async def execute(self, query: str, *args):
+        return await self._run("execute", query, args)
+
+    async def fetchval(self, query: str, *args):
+        return await self._run("fetchval", query, args)
+
+
+def _exclude_user(rows: list, exclude_user_id: int = None) -> list:
+    """Drop the searching user's own master profile from shared search results"""
+    if exclude_user_id is None:
+        return rows
+    return [row for row in rows if row['user_id'] != exclude_user_id]
+
+
 class Database:
     def __init__(self, dsn: str):
         self.dsn = dsn
         self.pool: Optional[asyncpg.Pool] = None
-        # Cache placeholder (initialized in init)
+        # Cache placeholders (initialized in init)
         self.cache = None
+        self.pending_orders = None
+        # In-process master search index (initialized in init, SQL fallback if None)
+        self.search_index = None
+        # Shared search results (initialized in init, uncached if None)
+        self.search_cache = None
+        # Rendered master cards (initialized in init, uncached if None)
+        self.master_cards = None
+        # Per-query-shape timing (see /dev/queries), None if disabled
+        self.query_stats = QueryStats(SLOW_QUERY_MS) if QUERY_STATS else None
 
     async def connect(self):
         """Create connection pool"""
         if not self.pool:
             try:
-                self.pool = await asyncpg.create_pool(self.dsn)
+                self.pool = await asyncpg.create_pool(self.dsn, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
                 log.info("Connected to PostgreSQL")
             except Exception as e:
                 log.error(f"Failed to connect to PostgreSQL: {e}")
                 raise
 
-    async def init(self):
-        """Initialize DB and apply migrations"""
+    async def init(self, warm_up: bool = True):
+        """Initialize DB and apply migrations (warm_up=False lets the caller run warm_up() concurrently)"""
         await self.connect()
-        await self.apply_migrations()
-        from utils.cache import UserCache
+        applied = await self.apply_migrations()
+        if PHONE_E164_BACKFILL_VERSION in applied:
+            await self.report_duplicate_phones()
+        from utils.cache import UserCache, PendingOrderCache, SearchResultCache, MasterCardCache
         self.cache = UserCache()
-
-    async def apply_migrations(self):
-        """Apply init_pg.sql and other migrations tracking them in schema_migrations"""
-        async with self.pool.acquire() as conn:
-            # 1. Create migrations tracking table first
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS schema_migrations (
-                    version     INTEGER PRIMARY KEY,
-                    applied_at  TIMESTAMP NOT NULL DEFAULT NOW()
-                )
-            """)
-            
-            # 2. Get applied versions
-            applied_versions = await conn.fetch("SELECT version FROM schema_migrations")
-            applied_set = {row['version'] for row in applied_versions}
-            
-            # Migration 0: Initial Schema
-            if 0 not in applied_set:
-                migration_file = os.path.join(os.path.dirname(__file__), "migrations", "init_pg.sql")
-                if os.path.exists(migration_file):
-                    log.info("Applying init_pg.sql (initial schema)...")
-                    with open(migration_file, "r", encoding="utf-8") as f:
-                        sql = f.read()
-                    try:
-                        await conn.execute(sql)
-                        await conn.execute("INSERT INTO schema_migrations (version) VALUES (0)")
-                        log.info("✅ Applied migration 0 (init_pg.sql)")
-                    except Exception as e:
-                        log.error(f"❌ Failed to apply init_pg.sql: {e}")
-            
-            # Migration 1: Optimize Indexes
-            if 1 not in applied_set:
-                migration_file = os.path.join(os.path.dirname(__file__), "migrations", "001_optimize_indexes.sql")
-                if os.path.exists(migration_file):
-                    log.info("Applying 001_optimize_indexes.sql...")
-                    with open(migration_file, "r", encoding="utf-8") as f:
-                        sql = f.read()
-                    try:
-                        await conn.execute(sql)
-                        await conn.execute("INSERT INTO schema_migrations (version) VALUES (1)")
-                        log.info("✅ Applied migration 1 (optimize_indexes)")
-                    except Exception as e:
-                        log.error(f"❌ Failed to apply 001_optimize_indexes.sql: {e}")
-
-            # Migration 2: Create Complaints Table
-            if 2 not in applied_set:
-                migration_file = os.path.join(os.path.dirname(__file__), "migrations", "002_create_complaints.sql")
-                if os.path.exists(migration_file):
-                    log.info("Applying 002_create_complaints.sql...")
-                    with open(migration_file, "r", encoding="utf-8") as f:
-                        sql = f.read()
-                    try:
-                        await conn.execute(sql)
-                        await conn.execute("INSERT INTO schema_migrations (version) VALUES (2)")
-                        log.info("✅ Applied migration 2 (create_complaints)")
-                    except Exception as e:
-                        log.error(f"❌ Failed to apply 002_create_complaints.sql: {e}")
+        self.pending_orders = PendingOrderCache()
+        self.search_cache = SearchResultCache()
+        self.master_cards = MasterCardCache()
+        if warm_up:
+            await self.warm_up()
+
+    async def warm_up(self):
+        """Build in-memory structures that are read on the hot path"""
+        if USE_SEARCH_INDEX:
+            await self.load_search_index()
+
+    async def load_search_index(self):
+        """Build the in-memory master search index; search falls back to SQL on failure"""
+        from services.search_service import MasterSearchIndex
+        index = MasterSearchIndex()
+        try:
+            await index.load(self)
+            self.search_index = index
+        except Exception as e:
+            log.error(f"❌ Failed to load search index, using SQL search: {e}")
+            self.search_index = None
+
+    async def _refresh_search_index(self, master_id: int):
+        """Keep search index, cached search results and rendered cards in sync after a master write"""
+        await self._refresh_search_index_batch([master_id])
+
+    async def _refresh_search_index_batch(self, master_ids: List[int]):
+        """_refresh_search_index for several masters: one index query, one search cache pass"""
+        if not master_ids:
+            return
+        if self.master_cards:
+            for master_id in master_ids:
+                self.master_cards.invalidate_master(master_id)
+
+        if not self.search_index:
+            # Without the index we don't know where the master was listed
+            if self.search_cache:
+                self.search_cache.clear()
+            return
+
+        before = [self.search_index.masters.get(master_id) for master_id in master_ids]
+        try:
+            await self.search_index.refresh_masters(self, master_ids)
+        except Exception as e:
+            # Stale index is worse than no index - fall back to SQL until reload
+            log.error(f"❌ Failed to refresh search index for masters {master_ids}: {e}")
+            self.search_index = None
+            if self.search_cache:
+                self.search_cache.clear()
+            return
+
+        if self.search_cache:
+            # Old and new postings: a master may have left or joined a result list
+            after = [self.search_index.masters.get(master_id) for master_id in master_ids]
+            categories, districts = set(), set()
+            for entry in before + after:
+                if entry:
+                    categories |= entry['categories']
+                    districts |= entry['districts']
+            self.search_cache.invalidate_master(categories, districts)
+
+    async def apply_migrations(self) -> List[int]:
+        """Apply pending migrations/*.sql (tracked with checksums in schema_migrations); returns applied versions"""
+        from utils.migrations import MigrationRunner
+        return await MigrationRunner(
+            self.pool, lock_timeout=MIGRATION_LOCK_TIMEOUT, wait_timeout=MIGRATION_WAIT_TIMEOUT
+        ).run()
+
+    async def report_duplicate_phones(self):
+        """Log masters sharing a phone_e164 (they must be merged before the column can be UNIQUE)"""
+        duplicates = await self.fetch("""
+            SELECT phone_e164, array_agg(id ORDER BY id) AS master_ids
+            FROM masters
+            WHERE phone_e164 IS NOT NULL
+            GROUP BY phone_e164
+            HAVING COUNT(*) > 1
+        """)
+        for row in duplicates:
+            log.warning(f"⚠️ Duplicate master phone {row['phone_e164']}: masters {list(row['master_ids'])}")
+        return duplicates
 
     async def close(self):
         """Close DB connection pool"""
@@ -95,23 +266,105 @@ class Database:
             await self.pool.close()
             self.pool = None
 
+    # ===== Request Scope =====
+
+    @asynccontextmanager
+    async def request_scope(self):
+        """Reuse one connection and memoize reads for the duration of an update"""
+        if _request_scope.get() is not None or not self.pool:
+            # Nested scope (or DB not connected yet) - nothing to set up
+            yield _request_scope.get()
+            return
+
+        scope = RequestScope(self.pool)
+        token = _request_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _request_scope.reset(token)
+            await scope.release()
+            if self.query_stats:
+                self.query_stats.record_update(scope.queries)
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Connection for multi-statement work (transactions).
+        Inside a request scope this is the scope's connection; only use the
+        yielded conn in the body - calling self.fetch* there would deadlock.
+        Statements on it are recorded like self.fetch* (InstrumentedConnection).
+        """
+        scope = _request_scope.get()
+        if scope is None or scope.closed:
+            async with self.pool.acquire() as conn:
+                yield InstrumentedConnection(self, conn)
+            return
+
+        async with scope.lock:
+            # Assume the caller writes - drop memoized reads
+            scope.memo.clear()
+            try:
+                yield InstrumentedConnection(self, await scope.get_conn(), scope)
+            finally:
+                scope.idle()
+
     # ===== Basic Helpers =====
 
+    async def _call(self, conn, method: str, query: str, args: tuple):
+        """Run one statement, recording its timing in query_stats"""
+        if not self.query_stats:
+            return await getattr(conn, method)(query, *args)
+
+        started = time.perf_counter()
+        try:
+            result = await getattr(conn, method)(query, *args)
+        except Exception:
+            self.query_stats.record(method, query, args, time.perf_counter() - started, error=True)
+            raise
+        self.query_stats.record(method, query, args, time.perf_counter() - started, result)
+        return result
+
+    async def _run(self, method: str, query: str, *args):
+        scope = _request_scope.get()
+        if scope is None or scope.closed:
+            async with self.pool.acquire() as conn:
+                return await self._call(conn, method, query, args)
+
+        key = None
+        if method != "execute" and _is_read_query(query):
+            key = _memo_key(method, query, args)
+            if key is not None and key in scope.memo:
+                if self.query_stats:
+                    self.query_stats.memo_hits += 1
+                result = scope.memo[key]
+                return list(result) if isinstance(result, list) else result
+
+        async with scope.lock:
+            conn = await scope.get_conn()
+            scope.queries += 1
+            try:
+                result = await self._call(conn, method, query, args)
+            finally:
+                scope.idle()
+
+        if key is not None:
+            scope.memo[key] = result
+            return list(result) if isinstance(result, list) else result
+        if method == "execute" or not _is_read_query(query):
+            scope.memo.clear()
+        return result
+
     async def fetchrow(self, query: str, *args):
-        async with self.pool.acquire() as conn:
-            return await conn.fetchrow(query, *args)
+        return await self._run("fetchrow", query, *args)
 
     async def fetch(self, query: str, *args):
-        async with self.pool.acquire() as conn:
-            return await conn.fetch(query, *args)
+        return await self._run("fetch", query, *args)
 
     async def execute(self, query: str, *args):
-        async with self.pool.acquire() as conn:
-            return await conn.execute(query, *args)
+        return await self._run("execute", query, *args)
 
     async def fetchval(self, query: str, *args):
-        async with self.pool.acquire() as conn:
-            return await conn.fetchval(query, *args)
+        return await self._run("fetchval", query, *args)
 
     def debug_info(self):
         # Async methods can't be easily called here if this is used synchronously for debugging
@@ -155,13 +408,11 @@ class Database:
         return None
 
     async def get_user(self, user_id):
-        # Try to find in cache by user_id
+        # Try to find in cache by user_id (secondary index, TTL checked by cache)
         if self.cache:
-            for tg_id, (data, timestamp) in self.cache.cache.items():
-                if data.get('user_id') == user_id:
-                    # Check TTL logic is in cache.get but accessing raw cache here
-                    if time.time() - timestamp < self.cache.ttl:
-                        return data
+            cached = self.cache.get_by_user_id(user_id)
+            if cached:
+                return cached
         
         # Determine telegram_id if possible
         row = await self.fetchrow('SELECT telegram_id FROM users WHERE id=$1', user_id)
@@ -188,33 +439,25 @@ class Database:
         await self.execute('UPDATE users SET is_master=$1 WHERE id=$2', is_master, user_id)
         # Invalidate cache
         if self.cache:
-            keys_to_del = [k for k, (v, _) in self.cache.cache.items() if v.get('user_id') == user_id]
-            for k in keys_to_del:
-                self.cache.invalidate(k)
+            self.cache.invalidate_user(user_id)
 
     async def update_user_status(self, user_id: int, status: str):
         await self.execute('UPDATE users SET status=$1 WHERE id=$2', status, user_id)
         if self.cache:
-            keys_to_del = [k for k, (v, _) in self.cache.cache.items() if v.get('user_id') == user_id]
-            for k in keys_to_del:
-                self.cache.invalidate(k)
+            self.cache.invalidate_user(user_id)
 
     async def update_user_language(self, user_id: int, language: str):
         await self.execute('UPDATE users SET language=$1 WHERE id=$2', language, user_id)
         if self.cache:
-            keys_to_del = [k for k, (v, _) in self.cache.cache.items() if v.get('user_id') == user_id]
-            for k in keys_to_del:
-                self.cache.invalidate(k)
+            self.cache.invalidate_user(user_id)
 
     # ===== Masters API =====
     async def get_master_by_user_id(self, user_id: int):
         # Optimization: Check UserCache first
         if self.cache:
-            for tg_id, (data, timestamp) in self.cache.cache.items():
-                if data.get('user_id') == user_id:
-                    if not data.get('is_master'):
-                        return None
-                    break
+            cached = self.cache.get_by_user_id(user_id)
+            if cached and not cached.get('is_master'):
+                return None
 
         query = """
             SELECT m.*, u.telegram_id, u.username 
@@ -226,37 +469,44 @@ class Database:
         return dict(row) if row else None
 
     async def get_master_by_phone(self, phone: str):
-        variants = get_phone_search_variants(phone)
-        if not variants:
+        normalized_phone = normalize_phone(phone)
+        if not normalized_phone:
             return None
-        
-        # Postgres ANY($1) for IN clause with dynamic list
-        query = "SELECT * FROM masters WHERE phone = ANY($1::text[])"
-        row = await self.fetchrow(query, variants)
+
+        # Oldest profile wins for legacy duplicates
+        phone_e164 = to_e164(phone)
+        if phone_e164:
+            # Single probe on idx_masters_phone_e164
+            row = await self.fetchrow("SELECT * FROM masters WHERE phone_e164 = $1 ORDER BY id LIMIT 1", phone_e164)
+        else:
+            # Not E.164 (no phone_e164 stored) - rare, match the stored normalized phone
+            row = await self.fetchrow("SELECT * FROM masters WHERE phone = $1 ORDER BY id LIMIT 1", normalized_phone)
         return dict(row) if row else None
 
     async def create_master(self, user_id, name, phone, description, categories, districts, source, status='draft'):
         normalized_phone = normalize_phone(phone)
         
-        async with self.pool.acquire() as conn:
+        async with self.connection() as conn:
             async with conn.transaction():
                 # Insert master
                 master_id = await conn.fetchval("""
-                    INSERT INTO masters (user_id, name, phone, description, status, source, created_at) 
-                    VALUES ($1, $2, $3, $4, $5, $6, NOW())
+                    INSERT INTO masters (user_id, name, phone, phone_e164, description, status, source, created_at) 
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, NOW())
                     RETURNING id
-                """, user_id, name, normalized_phone, description, status, source)
+                """, user_id, name, normalized_phone, to_e164(phone), description, status, source)
                 
-                # Insert categories
+                # Insert categories / districts (one set-based statement per table)
                 if categories:
-                    # Using executemany for bulk insert could be faster but loop is fine for small count
-                    for category_id in categories:
-                        await conn.execute("INSERT INTO master_categories (master_id, category_id) VALUES ($1, $2)", master_id, category_id)
+                    await conn.execute("""
+                        INSERT INTO master_categories (master_id, category_id)
+                        SELECT $1, unnest($2::int[]) ON CONFLICT DO NOTHING
+                    """, master_id, list(set(categories)))
                 
-                # Insert districts
                 if districts:
-                    for district_id in districts:
-                        await conn.execute("INSERT INTO master_districts (master_id, district_id) VALUES ($1, $2)", master_id, district_id)
+                    await conn.execute("""
+                        INSERT INTO master_districts (master_id, district_id)
+                        SELECT $1, unnest($2::int[]) ON CONFLICT DO NOTHING
+                    """, master_id, list(set(districts)))
                 
                 # Log status
                 await conn.execute("""
@@ -265,13 +515,15 @@ class Database:
                 """, 'master', master_id, status)
                 
                 log.info(f"Successfully created master {master_id} for user {user_id}")
-                return master_id
+
+        await self._refresh_search_index(master_id)
+        return master_id
 
     async def link_master_to_user(self, master_id: int, user_id: int):
         old_status = await self.fetchval("SELECT status FROM masters WHERE id=$1", master_id)
         new_status = 'active_free'
         
-        async with self.pool.acquire() as conn:
+        async with self.connection() as conn:
             async with conn.transaction():
                 await conn.execute("UPDATE masters SET user_id=$1, status=$2 WHERE id=$3", user_id, new_status, master_id)
                 
@@ -280,42 +532,54 @@ class Database:
                     VALUES ($1, $2, $3, $4, $5, NOW())
                 """, 'master', master_id, old_status, new_status, user_id)
 
+        await self._refresh_search_index(master_id)
+
         # Invalidate cache
         if self.cache:
-            keys_to_del = [k for k, (v, _) in self.cache.cache.items() if v.get('user_id') == user_id]
-            for k in keys_to_del:
-                self.cache.invalidate(k)
+            self.cache.invalidate_user(user_id)
 
     async def update_master_profile(self, master_id, name, phone, description, categories, districts):
         normalized_phone = normalize_phone(phone)
         
-        async with self.pool.acquire() as conn:
+        async with self.connection() as conn:
             async with conn.transaction():
                 await conn.execute("""
-                    UPDATE masters SET name=$1, phone=$2, description=$3 WHERE id=$4
-                """, name, normalized_phone, description, master_id)
+                    UPDATE masters SET name=$1, phone=$2, phone_e164=$3, description=$4 WHERE id=$5
+                """, name, normalized_phone, to_e164(phone), description, master_id)
                 
-                # Update categories
-                await conn.execute("DELETE FROM master_categories WHERE master_id=$1", master_id)
-                for category_id in categories:
-                    await conn.execute("INSERT INTO master_categories (master_id, category_id) VALUES ($1, $2)", master_id, category_id)
+                # Update categories / districts as a diff: drop removed, add new, keep the rest
+                category_ids = list(set(categories or []))
+                await conn.execute("""
+                    DELETE FROM master_categories WHERE master_id=$1 AND NOT (category_id = ANY($2::int[]))
+                """, master_id, category_ids)
+                await conn.execute("""
+                    INSERT INTO master_categories (master_id, category_id)
+                    SELECT $1, unnest($2::int[]) ON CONFLICT DO NOTHING
+                """, master_id, category_ids)
                 
-                # Update districts
-                await conn.execute("DELETE FROM master_districts WHERE master_id=$1", master_id)
-                for district_id in districts:
-                    await conn.execute("INSERT INTO master_districts (master_id, district_id) VALUES ($1, $2)", master_id, district_id)
+                district_ids = list(set(districts or []))
+                await conn.execute("""
+                    DELETE FROM master_districts WHERE master_id=$1 AND NOT (district_id = ANY($2::int[]))
+                """, master_id, district_ids)
+                await conn.execute("""
+                    INSERT INTO master_districts (master_id, district_id)
+                    SELECT $1, unnest($2::int[]) ON CONFLICT DO NOTHING
+                """, master_id, district_ids)
+
+        await self._refresh_search_index(master_id)
         return True
 
     async def update_master_status(self, master_id: int, status: str, changed_by: int = None):
         old_status = await self.fetchval("SELECT status FROM masters WHERE id=$1", master_id)
         if old_status:
-            async with self.pool.acquire() as conn:
+            async with self.connection() as conn:
                 async with conn.transaction():
                     await conn.execute('UPDATE masters SET status=$1 WHERE id=$2', status, master_id)
                     await conn.execute("""
                         INSERT INTO status_logs (entity_type, entity_id, old_status, new_status, changed_by, created_at) 
                         VALUES ($1, $2, $3, $4, $5, NOW())
                     """, 'master', master_id, old_status, status, changed_by)
+            await self._refresh_search_index(master_id)
 
     async def get_master_categories(self, master_id: int):
         rows = await self.fetch("""
@@ -374,6 +638,10 @@ class Database:
         rows = await self.fetch("SELECT * FROM districts ORDER BY key_field")
         return [dict(r) for r in rows]
 
+    async def get_district_adjacency(self):
+        rows = await self.fetch("SELECT district_id, neighbor_id FROM district_adjacency")
+        return [dict(r) for r in rows]
+
     async def is_premium_master(self, master_id: int):
         row = await self.fetchrow("SELECT premium_until FROM masters WHERE id=$1", master_id)
         if row and row['premium_until']:
@@ -381,6 +649,46 @@ class Database:
             return row['premium_until'] > datetime.datetime.utcnow()
         return False
 
+    async def expire_premium(self, batch_size: int = 500) -> Optional[List[dict]]:
+        """
+        Downgrade up to batch_size masters whose premium_until (UTC) has passed to
+        active_free, logging each change. Returns the downgraded masters with their
+        owner's telegram_id/language, or None if another replica holds the leader lock.
+        """
+        async with self.connection() as conn:
+            async with conn.transaction():
+                # Transaction-level lock: released on commit, nothing to clean up if we crash
+                if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", PREMIUM_EXPIRY_LOCK_KEY):
+                    return None
+
+                rows = await conn.fetch("""
+                    WITH expired AS (
+                        UPDATE masters SET status = 'active_free'
+                        WHERE id IN (
+                            SELECT id FROM masters
+                            WHERE status = 'active_premium'
+                              AND premium_until <= (NOW() AT TIME ZONE 'UTC')
+                            ORDER BY premium_until
+                            LIMIT $1
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING id, user_id, name
+                    ), logged AS (
+                        INSERT INTO status_logs (entity_type, entity_id, old_status, new_status, created_at)
+                        SELECT 'master', id, 'active_premium', 'active_free', NOW() FROM expired
+                    )
+                    SELECT e.id, e.user_id, e.name, u.telegram_id, u.language
+                    FROM expired e
+                    LEFT JOIN users u ON u.id = e.user_id
+                """, batch_size)
+
+        masters = [dict(r) for r in rows]
+        await self._refresh_search_index_batch([master['id'] for master in masters])
+        if self.cache:
+            for master in masters:
+                self.cache.invalidate_user(master['user_id'])
+        return masters
+
     async def get_master(self, master_id: int):
         # Optimized query with aggregations to avoid N+1 problem
         # Note: We use array_agg to get related IDs/keys in a single query.
@@ -398,10 +706,7 @@ class Database:
                        FROM master_districts md
                        JOIN districts d ON md.district_id = d.id
                        WHERE md.master_id = m.id
-                   ) as districts,
-                   (
-                        SELECT COUNT(*) FROM orders o WHERE o.master_id = m.id AND o.status = 'completed'
-                   ) as completed_orders_count
+                   ) as districts
             FROM masters m
             LEFT JOIN users u ON m.user_id = u.id
             WHERE m.id = $1
@@ -421,51 +726,162 @@ class Database:
         if result.get('rating') is None:
             result['rating'] = 0.0
             
-        result['completed_orders'] = result['completed_orders_count']
-        del result['completed_orders_count']
+        # Maintained counter (see complete_order)
+        result['completed_orders'] = result.get('completed_count') or 0
         
         return result
 
-    async def get_master_reviews(self, master_id: int):
-        rows = await self.fetch("""
-            SELECT * FROM orders WHERE master_id = $1 and status = 'completed'
-        """, master_id)
-        return [dict(r) for r in rows]
+    async def get_master_review_page(self, master_id: int, limit: int = 5, after_id: int = None, before_id: int = None):
+        """
+        Keyset page of a master's reviews (completed orders with rating or text), newest first.
+        after_id: last review of the current page -> older page; before_id: first review -> newer page.
+        Served by idx_orders_master_reviews; one extra row tells whether a neighbour page exists.
+        A boundary id that isn't one of this master's completed orders yields an empty page.
+        """
+        args = [master_id, limit + 1]
+        if before_id is not None:
+            args.append(before_id)
+            cursor_clause = "AND (completed_at, id) > (SELECT completed_at, id FROM orders WHERE id = $3 AND master_id = $1 AND status = 'completed')"
+            order = "ASC"
+        else:
+            cursor_clause = ""
+            if after_id is not None:
+                args.append(after_id)
+                cursor_clause = "AND (completed_at, id) < (SELECT completed_at, id FROM orders WHERE id = $3 AND master_id = $1 AND status = 'completed')"
+            order = "DESC"
+
+        rows = await self.fetch(f"""
+            SELECT id, rating, price, review_text, completed_at
+            FROM orders
+            WHERE master_id = $1 AND status = 'completed'
+            AND (rating IS NOT NULL OR review_text IS NOT NULL)
+            {cursor_clause}
+            ORDER BY completed_at {order}, id {order}
+            LIMIT $2
+        """, *args)
+
+        reviews = [dict(r) for r in rows]
+        has_more = len(reviews) > limit
+        reviews = reviews[:limit]
+        if before_id is not None:
+            reviews.reverse()
+        return {
+            'reviews': reviews,
+            'has_prev': has_more if before_id is not None else after_id is not None,
+            'has_next': has_more if before_id is None else True,
+        }
 
     async def create_order(self, client_id: int, master_id: int, category_id: int = None):
-        return await self.fetchval("""
+        order_id = await self.fetchval("""
             INSERT INTO orders (client_id, master_id, category_id, status, created_at) 
             VALUES ($1, $2, $3, 'active', NOW())
             RETURNING id
         """, client_id, master_id, category_id)
+        if self.pending_orders:
+            self.pending_orders.invalidate(client_id)
+        return order_id
 
     async def get_client_pending_order(self, client_id: int):
-        # 24 hours ago
-        # PostgreSQL supports interval syntax
+        """Oldest active order older than 24h (cached verdict, see PendingOrderCache)"""
+        if self.pending_orders:
+            hit, pending_order = self.pending_orders.get(client_id)
+            if hit:
+                return pending_order
+
+        # Oldest active order decides both "blocked now" and "blocked when"
+        # (seconds_left computed by PG to avoid clock/timezone mismatch)
         query = """
-            SELECT o.*, m.name as master_name, m.phone as master_phone 
+            SELECT o.*, m.name as master_name, m.phone as master_phone,
+                   EXTRACT(EPOCH FROM (o.created_at + INTERVAL '24 hours' - NOW())) as seconds_left
             FROM orders o 
             JOIN masters m ON o.master_id = m.id
             WHERE o.client_id = $1 
             AND o.status = 'active'
-            AND o.created_at < (NOW() - INTERVAL '24 hours')
             ORDER BY o.created_at ASC
             LIMIT 1
         """
         row = await self.fetchrow(query, client_id)
-        return dict(row) if row else None
+
+        pending_order = None
+        valid_for = None  # no active orders - valid until create_order
+        if row:
+            order = dict(row)
+            seconds_left = float(order.pop('seconds_left'))
+            if seconds_left < 0:
+                # Overdue - stays blocked until complete_order
+                pending_order = order
+            else:
+                valid_for = seconds_left
+
+        if self.pending_orders:
+            self.pending_orders.set(client_id, pending_order, valid_for)
+        return pending_order
 
     async def complete_order(self, order_id: int, rating: int = None, review: str = None, price: int = None):
-        if rating is not None:
-             await self.execute("""
-                UPDATE orders SET status='completed', completed_at=NOW(), rating=$2, review_text=$3, price=$4 WHERE id=$1
-            """, order_id, rating, review, price)
-        else:
-            await self.execute("""
-                UPDATE orders SET status='completed', completed_at=NOW() WHERE id=$1
-            """, order_id)
+        async with self.connection() as conn:
+            async with conn.transaction():
+                old = await conn.fetchrow("SELECT client_id, master_id, status, rating FROM orders WHERE id=$1 FOR UPDATE", order_id)
+                if not old:
+                    return
+
+                if rating is not None:
+                    await conn.execute("""
+                        UPDATE orders SET status='completed', completed_at=NOW(), rating=$2, review_text=$3, price=$4 WHERE id=$1
+                    """, order_id, rating, review, price)
+                    new_rating = rating
+                else:
+                    await conn.execute("""
+                        UPDATE orders SET status='completed', completed_at=NOW() WHERE id=$1
+                    """, order_id)
+                    new_rating = old['rating']
+
+                # Keep masters counters in step (re-completing an order only applies the rating delta)
+                old_counts = _order_counters(old['rating']) if old['status'] == 'completed' else (0, 0, 0)
+                new_counts = _order_counters(new_rating)
+                delta = [n - o for n, o in zip(new_counts, old_counts)]
+                if any(delta):
+                    await conn.execute("""
+                        UPDATE masters SET
+                            completed_count = completed_count + $2,
+                            rated_count = rated_count + $3,
+                            satisfied_count = satisfied_count + $4
+                        WHERE id = $1
+                    """, old['master_id'], *delta)
+
+        if self.pending_orders:
+            self.pending_orders.invalidate(old['client_id'])
+        await self._refresh_search_index(old['master_id'])
 
     async def search_masters(self, category_ids: list[int], district_ids: list[int], exclude_user_id: int = None):
+        """Rows are shared through search_cache - treat them as read-only"""
+        if not category_ids or not district_ids:
+            return []
+
+        async def run():
+            if self.search_index:
+                return self.search_index.search(category_ids, district_ids)
+            return await self.search_masters_sql(category_ids, district_ids)
+
+        key = ("districts", tuple(sorted(set(category_ids))), tuple(sorted(set(district_ids))))
+        rows = await self._cached_search(key, run, category_ids, district_ids)
+        return _exclude_user(rows, exclude_user_id)
+
+    async def _cached_search(self, key: tuple, run, category_ids=None, district_ids=None):
+        """
+        Serve a search from search_cache. Entries are shared by all users, so they are
+        computed without exclude_user_id and filtered per caller (see _exclude_user).
+        """
+        if self.search_cache is None:
+            return await run()
+        rows = self.search_cache.get(key)
+        if rows is None:
+            generation = self.search_cache.generation()
+            rows = await run()
+            self.search_cache.set(key, rows, category_ids, district_ids, generation)
+        return rows
+
+    async def search_masters_sql(self, category_ids: list[int], district_ids: list[int], exclude_user_id: int = None):
+        """SQL search (fallback when the in-memory search index is unavailable)"""
         if not category_ids or not district_ids:
             return []
 
@@ -479,8 +895,7 @@ class Database:
             args.append(exclude_user_id)
         
         sql = f"""
-            SELECT m.*, u.username, u.telegram_id,
-                   (SELECT COUNT(*) FROM orders o WHERE o.master_id = m.id AND o.status = 'completed') as completed_count
+            SELECT m.*, u.username, u.telegram_id
             FROM masters m
             LEFT JOIN users u ON m.user_id = u.id
             WHERE m.status NOT IN ('blocked')
@@ -491,27 +906,164 @@ class Database:
                 CASE WHEN m.status = 'active_premium' THEN 0
                 WHEN m.status = 'active_free' THEN 1
                 else 2 END,
-                m.rating DESC,
-                completed_count DESC;
+                COALESCE(m.rating, 0) DESC,
+                COALESCE(m.completed_count, 0) DESC,
+                m.id;
         """
         rows = await self.fetch(sql, *args)
         return [dict(r) for r in rows]
 
+    async def search_masters_nearby(self, category_ids: list[int], district_rings: dict, exclude_user_id: int = None, min_results: int = None):
+        """
+        Fallback when search_masters is empty: widen the districts ring by ring
+        (district_rings from CacheService.district_rings) until min_results masters.
+        Rows carry 'ring'; all rings are evaluated in one index pass / one query.
+        """
+        from services.search_service import NEARBY_MIN_RESULTS
+        min_results = min_results or NEARBY_MIN_RESULTS
+        if not category_ids or not district_rings:
+            return []
+
+        # Rings are derived from the selected (ring 0) districts, so those identify the search;
+        # any district may be in the result -> invalidated by category only
+        selected = tuple(sorted(d for d, ring in district_rings.items() if ring == 0))
+        key = ("nearby", tuple(sorted(set(category_ids))), selected, min_results)
+        rows = await self._cached_search(
+            key, lambda: self._search_masters_nearby(category_ids, district_rings, min_results), category_ids, None
+        )
+        return _exclude_user(rows, exclude_user_id)
+
+    async def _search_masters_nearby(self, category_ids: list[int], district_rings: dict, min_results: int):
+        from services.search_service import cut_rings
+        if self.search_index:
+            return self.search_index.search_nearby(category_ids, district_rings, min_results=min_results)
+
+        district_ids = list(district_rings)
+        args = [category_ids, district_ids, [district_rings[d] for d in district_ids]]
+
+        rows = await self.fetch("""
+            WITH rings AS (
+                SELECT * FROM unnest($2::int[], $3::int[]) AS r(district_id, ring)
+            )
+            SELECT m.*, u.username, u.telegram_id, nearest.ring
+            FROM masters m
+            LEFT JOIN users u ON m.user_id = u.id
+            JOIN LATERAL (
+                SELECT MIN(r.ring) AS ring
+                FROM master_districts md
+                JOIN rings r ON r.district_id = md.district_id
+                WHERE md.master_id = m.id
+            ) nearest ON nearest.ring IS NOT NULL
+            WHERE m.status NOT IN ('blocked')
+            AND EXISTS (SELECT 1 FROM master_categories mc WHERE mc.master_id = m.id AND mc.category_id = ANY($1::int[]))
+            ORDER BY
+                nearest.ring,
+                CASE WHEN m.status = 'active_premium' THEN 0
+                WHEN m.status = 'active_free' THEN 1
+                else 2 END,
+                COALESCE(m.rating, 0) DESC,
+                COALESCE(m.completed_count, 0) DESC,
+                m.id;
+        """, *args)
+        return cut_rings([dict(r) for r in rows], min_results)
+
+    async def search_masters_text(self, text: str, category_ids: list[int] = None, exclude_user_id: int = None, limit: int = None):
+        """
+        Free-text search: masters whose name/description contains every term
+        (idx_masters_text_trgm) or who serve one of category_ids (matched by
+        name via CacheService.match_categories). Same ordering as search_masters.
+        """
+        from services.search_service import tokenize, MIN_TERM_LENGTH, MAX_TERMS, TEXT_SEARCH_LIMIT
+        limit = limit or TEXT_SEARCH_LIMIT
+        category_ids = list(category_ids or [])
+        terms = [t for t in tokenize(text) if len(t) >= MIN_TERM_LENGTH][:MAX_TERMS]
+        if not terms and not category_ids:
+            return []
+
+        # Name/description matches can't be attributed to categories/districts -> invalidated by any master write
+        key = ("text", tuple(terms), tuple(sorted(set(category_ids))), limit)
+        rows = await self._cached_search(key, lambda: self._search_masters_text(terms, category_ids, limit))
+        return _exclude_user(rows, exclude_user_id)
+
+    async def _search_masters_text(self, terms: list[str], category_ids: list[int], limit: int):
+        # ILIKE per term so every condition can use the trigram index
+        args = []
+        conditions = []
+        for term in terms:
+            # Terms are \w+ words; "_" is the only LIKE wildcard they can contain
+            args.append("%" + term.replace("_", "\\_") + "%")
+            conditions.append(f"(m.name || ' ' || coalesce(m.description, '')) ILIKE ${len(args)}")
+        text_clause = " AND ".join(conditions)
+
+        if self.search_index:
+            master_ids = []
+            if text_clause:
+                # Ids only; the index ranks them together with the category postings
+                rows = await self.fetch(f"""
+                    SELECT m.id FROM masters m
+                    WHERE m.status NOT IN ('blocked') AND {text_clause}
+                    LIMIT 5000
+                """, *args)
+                master_ids = [r['id'] for r in rows]
+            return self.search_index.rank(master_ids, category_ids, limit=limit)
+
+        match_clauses = [f"({text_clause})"] if text_clause else []
+        if category_ids:
+            args.append(category_ids)
+            match_clauses.append(
+                f"EXISTS (SELECT 1 FROM master_categories mc WHERE mc.master_id = m.id AND mc.category_id = ANY(${len(args)}::int[]))"
+            )
+        args.append(limit)
+
+        rows = await self.fetch(f"""
+            SELECT m.*, u.username, u.telegram_id
+            FROM masters m
+            LEFT JOIN users u ON m.user_id = u.id
+            WHERE m.status NOT IN ('blocked')
+            AND ({" OR ".join(match_clauses)})
+            ORDER BY
+                CASE WHEN m.status = 'active_premium' THEN 0
+                WHEN m.status = 'active_free' THEN 1
+                else 2 END,
+                COALESCE(m.rating, 0) DESC,
+                COALESCE(m.completed_count, 0) DESC,
+                m.id
+            LIMIT ${len(args)}
+        """, *args)
+        return [dict(r) for r in rows]
+
     async def update_master_rating(self, master_id: int):
+        # rating IS NOT NULL doesn't change the AVG; it lets idx_orders_master_reviews serve the scan
         await self.execute("""
             UPDATE masters 
-            SET rating = (SELECT AVG(rating) FROM orders WHERE master_id = $1 AND status = 'completed') 
+            SET rating = (SELECT AVG(rating) FROM orders WHERE master_id = $1 AND status = 'completed' AND rating IS NOT NULL) 
             WHERE id = $1
         """, master_id)
+        await self._refresh_search_index(master_id)
+
+    async def get_master_index_rows(self, master_ids: List[int] = None):
+        """Masters with category/district ids and sort keys for MasterSearchIndex (all if master_ids is None)"""
+        where_clause = "WHERE m.id = ANY($1::int[])" if master_ids is not None else ""
+        args = [list(master_ids)] if master_ids is not None else []
+        rows = await self.fetch(f"""
+            SELECT m.*, u.username, u.telegram_id,
+                   (SELECT array_agg(mc.category_id) FROM master_categories mc WHERE mc.master_id = m.id) as category_ids,
+                   (SELECT array_agg(md.district_id) FROM master_districts md WHERE md.master_id = m.id) as district_ids
+            FROM masters m
+            LEFT JOIN users u ON m.user_id = u.id
+            {where_clause}
+        """, *args)
+        return [dict(r) for r in rows]
 
     async def get_master_order_stats(self, master_id: int):
+        # Reads counters maintained by complete_order instead of aggregating orders
         row = await self.fetchrow("""
             SELECT 
-                COUNT(*) as total_orders,
-                SUM(CASE WHEN rating >= 4 THEN 1 ELSE 0 END) as satisfied_clients,
-                COUNT(rating) as rated_orders
-            FROM orders 
-            WHERE master_id = $1 AND status = 'completed'
+                completed_count as total_orders,
+                satisfied_count as satisfied_clients,
+                rated_count as rated_orders
+            FROM masters 
+            WHERE id = $1
         """, master_id)
         return dict(row) if row else {'total_orders': 0, 'satisfied_clients': 0, 'rated_orders': 0}
 
@@ -529,17 +1081,6 @@ class Database:
         row = await self.fetchrow("SELECT * FROM orders WHERE id = $1", order_id)
         return dict(row) if row else None
 
-    async def get_client_orders(self, client_id: int):
-        rows = await self.fetch("""
-            SELECT o.*, m.name as master_name, m.phone as master_phone, c.key_field as category_key
-            FROM orders o
-            JOIN masters m ON o.master_id = m.id
-            LEFT JOIN categories c ON o.category_id = c.id
-            WHERE o.client_id = $1
-            ORDER BY CASE WHEN o.status = 'active' THEN 1 ELSE 2 END ASC, o.created_at DESC
-        """, client_id)
-        return [dict(r) for r in rows]
-
     async def get_active_orders_count(self, client_id: int) -> int:
         return await self.fetchval("SELECT COUNT(*) FROM orders WHERE client_id = $1 AND status = 'active'", client_id)
 
@@ -554,17 +1095,65 @@ class Database:
         """, client_id)
         return [dict(r) for r in rows]
 
-    async def get_completed_orders(self, client_id: int, limit: int = 10, offset: int = 0):
-        rows = await self.fetch("""
-            SELECT o.*, m.name as master_name, c.key_field as category_key
-            FROM orders o
-            JOIN masters m ON o.master_id = m.id
-            LEFT JOIN categories c ON o.category_id = c.id
-            WHERE o.client_id = $1 AND o.status = 'completed'
-            ORDER BY o.created_at DESC
-            LIMIT $2 OFFSET $3
-        """, client_id, limit, offset)
-        return [dict(r) for r in rows]
+    async def get_completed_orders_page(self, client_id: int, limit: int = 5, after_id: int = None, before_id: int = None):
+        """
+        Keyset page of completed orders, newest first, with the client's completed
+        and active counts from the same query.
+
+        after_id: last order of the current page -> older page
+        before_id: first order of the current page -> newer page
+        One extra row is read to tell whether the page has a neighbour in that direction.
+        Boundary ids come from callback data: one that isn't this client's completed
+        order matches nothing and yields an empty page.
+        """
+        args = [client_id, limit + 1]
+        if before_id is not None:
+            args.append(before_id)
+            cursor_clause = "AND (o.created_at, o.id) > (SELECT created_at, id FROM orders WHERE id = $3 AND client_id = $1 AND status = 'completed')"
+            order = "ASC"
+        else:
+            cursor_clause = ""
+            if after_id is not None:
+                args.append(after_id)
+                cursor_clause = "AND (o.created_at, o.id) < (SELECT created_at, id FROM orders WHERE id = $3 AND client_id = $1 AND status = 'completed')"
+            order = "DESC"
+
+        # idx_orders_client_status_created serves both the counts and the page range scan
+        rows = await self.fetch(f"""
+            WITH counts AS (
+                SELECT COUNT(*) FILTER (WHERE status = 'completed') AS completed_count,
+                       COUNT(*) FILTER (WHERE status = 'active') AS active_count
+                FROM orders
+                WHERE client_id = $1 AND status IN ('completed', 'active')
+            )
+            SELECT counts.completed_count, counts.active_count, page.*
+            FROM counts
+            LEFT JOIN LATERAL (
+                SELECT o.*, m.name as master_name, c.key_field as category_key
+                FROM orders o
+                JOIN masters m ON o.master_id = m.id
+                LEFT JOIN categories c ON o.category_id = c.id
+                WHERE o.client_id = $1 AND o.status = 'completed'
+                {cursor_clause}
+                ORDER BY o.created_at {order}, o.id {order}
+                LIMIT $2
+            ) page ON TRUE
+        """, *args)
+
+        first = rows[0]
+        orders = [dict(r) for r in rows if r['id'] is not None]
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        if before_id is not None:
+            orders.reverse()
+        return {
+            'orders': orders,
+            'completed_count': first['completed_count'],
+            'active_count': first['active_count'],
+            # Newer/older neighbour pages exist
+            'has_prev': has_more if before_id is not None else after_id is not None,
+            'has_next': has_more if before_id is None else True,
+        }
 
     async def get_completed_orders_count(self, client_id: int) -> int:
         return await self.fetchval("SELECT COUNT(*) FROM orders WHERE client_id = $1 AND status = 'completed'", client_id)
@@ -654,11 +1243,22 @@ class Database:
         return [dict(r) for r in rows]
 
     async def save_votes(self, from_client: bool, order_id: int, criterion_ids: list[int]):
-        async with self.pool.acquire() as conn:
+        # Diff against existing votes: only removed/added criteria are written
+        criterion_ids = list(set(criterion_ids or []))
+        async with self.connection() as conn:
             async with conn.transaction():
-                await conn.execute("DELETE FROM reputation_votes WHERE order_id=$1 AND from_client=$2", order_id, from_client)
-                for cid in criterion_ids:
-                    await conn.execute("INSERT INTO reputation_votes (from_client, order_id, criterion_id) VALUES ($1, $2, $3)", from_client, order_id, cid)
+                await conn.execute("""
+                    DELETE FROM reputation_votes
+                    WHERE order_id=$1 AND from_client=$2 AND NOT (criterion_id = ANY($3::int[]))
+                """, order_id, from_client, criterion_ids)
+                await conn.execute("""
+                    INSERT INTO reputation_votes (from_client, order_id, criterion_id)
+                    SELECT $1, $2, c.id FROM unnest($3::int[]) AS c(id)
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM reputation_votes rv
+                        WHERE rv.order_id = $2 AND rv.from_client = $1 AND rv.criterion_id = c.id
+                    )
+                """, from_client, order_id, criterion_ids)
 
     async def get_user_reputation_stats(self, user_id: int = None, master_id: int = None):
         """
@@ -12,6 +12,7 @@ db: Optional[Database] = None
 # Service singletons
 user_service = None
 cache_service = None
+outbound = None
 
 def get_bot() -> Bot:
     """Get bot instance"""
@@ -23,4 +24,10 @@ def get_db() -> Database:
     """Get database instance"""
     if db is None:
         raise RuntimeError("Database not initialized yet")
-    return db
\ No newline at end of file
+    return db
+
+def get_outbound():
+    """Get shared outbound sender"""
+    if outbound is None:
+        raise RuntimeError("Outbound sender not initialized yet")
+    return outbound
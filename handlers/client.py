@@ -2,6 +2,7 @@
 # handlers/client.py — Client Commands & Flows
 # ================================
 
+import html
 import logging
 from typing import Union
 
@@ -49,6 +50,7 @@ from services.stickers import replace_sticker, StickerEvent, clear_state_preserv
 
 db = globals.get_db()
 bot = globals.get_bot()
+outbound = globals.get_outbound()
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -395,9 +397,9 @@ async def toggle_category_selection(callback: CallbackQuery, state: FSMContext,
     await state.update_data(selected_category_ids=selected_ids)
     
     # Refresh current level
-    # We need to know the parent_id to refresh. 
-    # We can get it from the database or store in state.
-    cat = await db.get_category(cat_id)
+    # We need to know the parent_id to refresh.
+    # Resolved from the in-memory category tree (no DB query).
+    cat = globals.cache_service.get_category(cat_id)
     parent_id = cat['parent_id'] if cat else None
     
     markup = await get_categories_keyboard_v2(parent_id=parent_id, selected_ids=selected_ids, lang=lang)
@@ -405,6 +407,29 @@ async def toggle_category_selection(callback: CallbackQuery, state: FSMContext,
     await callback.answer()
 
 
+# Commands are filtered out (not returned from) so they reach the other routers
+@router.message(ClientFindMaster.select_service, F.text & ~F.text.startswith("/"))
+async def search_masters_by_text(message: Message, state: FSMContext, user: dict = None):
+    """Typed query instead of tapping through the category tree"""
+    lang = user.get('language', 'ru') if user else 'ru'
+    query = message.text.strip()
+
+    category_ids = globals.cache_service.match_categories(query)
+    exclude_user_id = user['id'] if user else None
+    masters = await db.search_masters_text(query, category_ids, exclude_user_id=exclude_user_id)
+
+    if not masters:
+        # Stay in select_service so the user can retype or use the buttons
+        await message.answer(get_text("text_search_no_results", lang, query=html.escape(query[:64])))
+        return
+
+    await replace_sticker(message, state, StickerEvent.MASTER_FOUND)
+    # Only the query goes to FSM state; pages re-read the shared search cache
+    await state.update_data(search_query={"kind": "text", "text": query, "category_ids": category_ids}, current_page=0)
+    await state.set_state(ClientFindMaster.viewing_results)
+    await send_masters_page(message, state, 0, user=user)
+
+
 @router.callback_query(ClientFindMaster.select_service, F.data == "back_to_groups")
 async def back_to_groups(callback: CallbackQuery, state: FSMContext, user: dict = None):
     # Re-using menu_find_master logic for "back to root"
@@ -427,7 +452,7 @@ async def select_service_done(callback: CallbackQuery, state: FSMContext, user:
     category_names = []
     
     for cat_id in selected_ids:
-        cat = await db.get_category(cat_id)
+        cat = globals.cache_service.get_category(cat_id)
         if cat:
             cat_key = cat['key_field']
             category_keys.append(cat_key)
@@ -478,6 +503,12 @@ async def client_select_districts(callback: CallbackQuery, state: FSMContext, us
         
         # Search for masters matching this request, excluding the searching user
         masters = await db.search_masters(category_ids, district_ids, exclude_user_id=exclude_user_id)
+        search_kind = "districts"
+        if not masters:
+            # Nothing in the selected districts - widen to neighboring ones
+            district_rings = globals.cache_service.district_rings(district_ids)
+            masters = await db.search_masters_nearby(category_ids, district_rings, exclude_user_id=exclude_user_id)
+            search_kind = "nearby"
 
         if not masters:
             await replace_sticker(callback.message, state, StickerEvent.EMPTY)
@@ -500,7 +531,11 @@ async def client_select_districts(callback: CallbackQuery, state: FSMContext, us
         # So delete old and answer new.
         await callback.message.delete()
         
-        await state.update_data(masters_list=masters, current_page=0)
+        # Only the query goes to FSM state; pages re-read the shared search cache
+        await state.update_data(
+            search_query={"kind": search_kind, "category_ids": category_ids, "district_ids": district_ids},
+            current_page=0
+        )
         await state.set_state(ClientFindMaster.viewing_results)
         await send_masters_page(callback.message, state, 0, user=user)
         return
@@ -527,10 +562,31 @@ async def back_to_services(callback: CallbackQuery, state: FSMContext, user: dic
     await menu_find_master(callback, state, user)
 
 
+async def load_search_results(search_query: dict, user: dict = None) -> list:
+    """Results of the search stored in FSM state (normally a Database.search_cache hit)"""
+    if not search_query:
+        return []
+    exclude_user_id = user['id'] if user else None
+    kind = search_query.get("kind")
+    if kind == "text":
+        return await db.search_masters_text(
+            search_query["text"], search_query["category_ids"], exclude_user_id=exclude_user_id
+        )
+    if kind == "nearby":
+        district_rings = globals.cache_service.district_rings(search_query["district_ids"])
+        return await db.search_masters_nearby(
+            search_query["category_ids"], district_rings, exclude_user_id=exclude_user_id
+        )
+    return await db.search_masters(
+        search_query["category_ids"], search_query["district_ids"], exclude_user_id=exclude_user_id
+    )
+
+
 async def send_masters_page(message: Message, state: FSMContext, page: int = 0, user: dict = None):
     """Helper to send a specific page of master results"""
     data = await state.get_data()
-    all_masters = data.get("masters_list", [])
+    search_query = data.get("search_query")
+    all_masters = await load_search_results(search_query, user)
     lang = user.get('language', 'ru') if user else 'ru'
     
     # Calculate paging
@@ -546,7 +602,9 @@ async def send_masters_page(message: Message, state: FSMContext, page: int = 0,
     end_idx = start_idx + items_per_page
     page_masters = all_masters[start_idx:end_idx]
 
-    text = get_text("search_results_header", lang, count=len(all_masters))
+    nearby = search_query and search_query.get("kind") == "nearby"
+    header_key = "search_results_nearby_header" if nearby else "search_results_header"
+    text = get_text(header_key, lang, count=len(all_masters))
     
     # send_masters_page is called after we already handled sticker and deleted previous message in the caller.
     # So we should just Answer.
@@ -653,13 +711,13 @@ async def menu_my_orders(callback: CallbackQuery, state: FSMContext, user: dict
     await show_completed_orders_page(callback, user, 0)
 
 
-async def show_completed_orders_page(callback: CallbackQuery, user: dict, page: int):
-    """Helper to display paginated completed orders"""
+async def show_completed_orders_page(callback: CallbackQuery, user: dict, page: int = 0, after_id: int = None, before_id: int = None):
+    """Helper to display paginated completed orders (keyset: after_id -> older page, before_id -> newer page)"""
     lang = user.get('language', 'ru') if user else 'ru'
     
-    completed_orders = await db.get_completed_orders(user['id'], limit=5, offset=page*5)
-    total_count = await db.get_completed_orders_count(user['id'])
-    total_pages = (total_count + 4) // 5  # Round up
+    history = await db.get_completed_orders_page(user['id'], limit=5, after_id=after_id, before_id=before_id)
+    completed_orders = history['orders']
+    total_pages = (history['completed_count'] + 4) // 5  # Round up
     
     if not completed_orders:
         await callback.message.edit_text(
@@ -697,18 +755,30 @@ async def show_completed_orders_page(callback: CallbackQuery, user: dict, page:
     # Determine back button destination:
     # If there are active orders, "Back" should go to the "active orders" view (menu_my_orders).
     # If there are NO active orders, "Back" should go to the Main Menu (back_main_menu).
-    active_count = await db.get_active_orders_count(user['id'])
-    back_cb = "menu_my_orders" if active_count > 0 else "back_main_menu"
+    back_cb = "menu_my_orders" if history['active_count'] > 0 else "back_main_menu"
     
-    keyboard = get_orders_history_keyboard(page, total_pages, lang, back_callback=back_cb)
+    keyboard = get_orders_history_keyboard(
+        page, total_pages, lang, back_callback=back_cb,
+        first_id=completed_orders[0]['id'], last_id=completed_orders[-1]['id'],
+        has_prev=history['has_prev'], has_next=history['has_next']
+    )
     await callback.message.edit_text(text, reply_markup=keyboard)
 
 
 @router.callback_query(F.data.startswith("orders_history_page_"))
 async def orders_history_page(callback: CallbackQuery, state: FSMContext, user: dict = None):
-    """Handle pagination for order history"""
-    page = int(callback.data.split("_")[-1])
-    await show_completed_orders_page(callback, user, page)
+    """First page of order history (page numbers from old keyboards also land here)"""
+    await show_completed_orders_page(callback, user, 0)
+
+
+@router.callback_query(F.data.startswith("orders_history_next_") | F.data.startswith("orders_history_prev_"))
+async def orders_history_turn(callback: CallbackQuery, state: FSMContext, user: dict = None):
+    """Handle keyset pagination for order history: orders_history_{next|prev}_{boundary_id}_{page}"""
+    _, _, direction, boundary_id, page = callback.data.split("_")
+    if direction == "next":
+        await show_completed_orders_page(callback, user, int(page), after_id=int(boundary_id))
+    else:
+        await show_completed_orders_page(callback, user, int(page), before_id=int(boundary_id))
 
 
 # ====== CONCIERGE FLOW ======
@@ -805,7 +875,7 @@ async def concierge_name(message: Message, state: FSMContext, user: dict = None)
         filling_language = "Русский" if lang == "ru" else "Турецкий"
         
         for admin_tg_id in ADMIN_IDS:
-            await bot.send_message(
+            outbound.send_message(
                 admin_tg_id,
                 get_text(
                     "admin_concierge_new",
@@ -838,20 +908,11 @@ async def select_district(callback: CallbackQuery, state: FSMContext, user: dict
     await state.set_state(ClientSearch.select_category)
 
 # ====== MASTER PROFILE ======
-@router.callback_query(F.data.startswith("master_profile_"))
-async def view_master_profile(callback: CallbackQuery, state: FSMContext, user: dict = None):
-    """View master profile"""
-    lang = user.get('language', 'ru') if user else 'ru'
-    master_id = int(callback.data.split("_")[2])
-    
-    master = await db.get_master(master_id)
-    if not master:
-        await callback.answer("❌ Мастер не найден", show_alert=True)
-        return
-    
+def render_master_card(master: dict, stats: dict, lang: str):
+    """Client-facing master card: (text, keyboard)"""
     # Localize districts and categories
-    districts = [get_district_name(d, lang) for d in master.get('districts', [])]
-    categories = [get_category_name(c, lang) for c in master.get('categories', [])]
+    districts = [get_district_name(d, lang) for d in master.get('districts') or []]
+    categories = [get_category_name(c, lang) for c in master.get('categories') or []]
     
     status = master.get('status', 'pending')
     status_symbol = "👻"
@@ -873,7 +934,6 @@ async def view_master_profile(callback: CallbackQuery, state: FSMContext, user:
     )
 
     # Add localized order stats
-    stats = await db.get_master_order_stats(master_id)
     total_orders = stats['total_orders'] or 0
     satisfied_clients = stats['satisfied_clients'] or 0
     
@@ -884,7 +944,31 @@ async def view_master_profile(callback: CallbackQuery, state: FSMContext, user:
         percent = round((satisfied_clients / total_orders) * 100)
         text += f"\n{get_text('satisfied_clients_text', lang, percent=percent)}"
     
-    await callback.message.edit_text(text, reply_markup=get_master_profile_keyboard(master_id, lang))
+    return text, get_master_profile_keyboard(master['id'], lang)
+
+
+@router.callback_query(F.data.startswith("master_profile_"))
+async def view_master_profile(callback: CallbackQuery, state: FSMContext, user: dict = None):
+    """View master profile (rendered card cached per language until the master changes)"""
+    lang = user.get('language', 'ru') if user else 'ru'
+    master_id = int(callback.data.split("_")[2])
+    
+    cards = db.master_cards
+    view = ("card", lang)
+    card = cards.get(master_id, view) if cards else None
+    if card is None:
+        generation = cards.generation(master_id) if cards else 0
+        master = await db.get_master(master_id)
+        if not master:
+            await callback.answer("❌ Мастер не найден", show_alert=True)
+            return
+        stats = await db.get_master_order_stats(master_id)
+        card = render_master_card(master, stats, lang)
+        if cards:
+            cards.set(master_id, view, card, generation)
+    
+    text, markup = card
+    await callback.message.edit_text(text, reply_markup=markup)
 
 
 @router.callback_query(F.data.startswith("master_reputation_"))
@@ -929,8 +1013,7 @@ async def view_master_reputation(callback: CallbackQuery, state: FSMContext, use
 async def back_to_results(callback: CallbackQuery, state: FSMContext, user: dict = None):
     """Back to master list from profile"""
     data = await state.get_data()
-    masters = data.get("masters_list")
-    if not masters:
+    if not data.get("search_query"):
         # Fallback to menu if no results in state
         return await back_main_menu(callback, state, user)
         
@@ -966,13 +1049,10 @@ async def contact_master(callback: CallbackQuery, state: FSMContext, user: dict
         ])
     )
 
-@router.callback_query(F.data.startswith("master_reviews_"))
-async def view_master_reviews(callback: CallbackQuery, state: FSMContext, user: dict = None):
-    """View master reviews"""
-    master_id = int(callback.data.split("_")[2])
-    reviews = await db.get_master_reviews(master_id)
-    lang = user.get('language', 'ru') if user else 'ru'
-    
+def render_master_reviews(master_id: int, page: dict, lang: str):
+    """Review page text and keyboard: Prev/Next carry the boundary review id"""
+    reviews = page['reviews']
+
     # Localize headers and empty state using i18n
     header_text = get_text("master_reviews_header", lang)
     no_reviews_text = get_text("reviews_no", lang)
@@ -981,15 +1061,54 @@ async def view_master_reviews(callback: CallbackQuery, state: FSMContext, user:
         text = f"⭐ <b>{header_text}:</b> {no_reviews_text}"
     else:
         text = f"⭐ <b>{header_text}:</b>\n\n"
-        for review in reviews[:5]:  # Show last 5
-            text += f"{'⭐' * review['rating']} {review['price']}₺\n{review['review_text']}\n\n"
+        for review in reviews:
+            stars = '⭐' * review['rating'] if review['rating'] else ''
+            price = f" {review['price']}₺" if review['price'] is not None else ''
+            review_text = html.escape(review['review_text']) if review['review_text'] else ''
+            text += f"{stars}{price}\n{review_text}\n\n"
+
+    buttons = []
+    if reviews and (page['has_prev'] or page['has_next']):
+        nav_row = []
+        if page['has_prev']:
+            nav_row.append(InlineKeyboardButton(text="⬅️", callback_data=f"master_reviews_prev_{master_id}_{reviews[0]['id']}"))
+        if page['has_next']:
+            nav_row.append(InlineKeyboardButton(text="➡️", callback_data=f"master_reviews_next_{master_id}_{reviews[-1]['id']}"))
+        buttons.append(nav_row)
+    buttons.append([InlineKeyboardButton(text=get_text("btn_back", lang), callback_data=f"master_profile_{master_id}")])
     
-    await callback.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=get_text("btn_back", lang), callback_data=f"master_profile_{master_id}")]
-        ])
-    )
+    return text, InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+@router.callback_query(F.data.startswith("master_reviews_"))
+async def view_master_reviews(callback: CallbackQuery, state: FSMContext, user: dict = None):
+    """
+    View master reviews: master_reviews_{id} or master_reviews_{next|prev}_{id}_{review_id}
+    (ids last so the metrics prefix stays "master_reviews_next"); pages cached until the master changes
+    """
+    parts = callback.data.split("_")
+    if parts[2] in ("next", "prev"):
+        direction, master_id, boundary_id = parts[2], int(parts[3]), int(parts[4])
+    else:
+        direction, master_id, boundary_id = None, int(parts[2]), None
+    lang = user.get('language', 'ru') if user else 'ru'
+
+    cards = db.master_cards
+    view = ("reviews", lang, direction, boundary_id)
+    card = cards.get(master_id, view) if cards else None
+    if card is None:
+        generation = cards.generation(master_id) if cards else 0
+        page = await db.get_master_review_page(
+            master_id,
+            after_id=boundary_id if direction == "next" else None,
+            before_id=boundary_id if direction == "prev" else None,
+        )
+        card = render_master_reviews(master_id, page, lang)
+        if cards:
+            cards.set(master_id, view, card, generation)
+
+    text, markup = card
+    await callback.message.edit_text(text, reply_markup=markup)
 
 # ====== REPORT MASTER ======
 @router.callback_query(F.data.startswith("master_report_"))
@@ -1117,10 +1236,7 @@ async def start_order(callback: CallbackQuery, state: FSMContext, user: dict = N
                 category=category_name,
                 client_info=client_info
             )
-            try:
-                await bot.send_message(master_user['telegram_id'], notify_text)
-            except Exception as e:
-                logger.error(f"Could not notify master {master_id}: {e}")
+            outbound.send_message(master_user['telegram_id'], notify_text)
 
 
 # ====== ORDER COMPLETION & REVIEW ======
@@ -1356,7 +1472,7 @@ async def review_rating(callback: CallbackQuery, state: FSMContext, user: dict =
                     rating=rating
                 )
                 
-                await bot.send_message(master_user['telegram_id'], notify_text, reply_markup=rate_client_kb)
+                outbound.send_message(master_user['telegram_id'], notify_text, reply_markup=rate_client_kb)
     except Exception:
         logger.exception("Failed to notify master about order completion")
     
@@ -1485,7 +1601,7 @@ async def add_master_toggle_category_selection(callback: CallbackQuery, state: F
         
     await state.update_data(selected_category_ids=selected_ids)
     
-    cat = await db.get_category(cat_id)
+    cat = globals.cache_service.get_category(cat_id)
     parent_id = cat['parent_id'] if cat else None
     
     markup = await get_categories_keyboard_v2(parent_id=parent_id, selected_ids=selected_ids, lang=lang)
@@ -1526,7 +1642,7 @@ async def add_master_confirm(message: Message, state: FSMContext, user: dict = N
     category_ids = []
     category_names = []
     for cat_id in selected_category_ids:
-        cat = await db.get_category(cat_id)
+        cat = globals.cache_service.get_category(cat_id)
         if cat:
             category_ids.append(cat['id'])
             category_names.append(get_category_name(cat['key_field'], lang))
@@ -1735,10 +1851,7 @@ async def phone_verification_contact(message: Message, state: FSMContext, user:
                         category=category_name,
                         client_info=client_info
                     )
-                    try:
-                        await bot.send_message(master_user['telegram_id'], notify_text)
-                    except Exception as e:
-                        logger.error(f"Could not notify master {pending_master_id}: {e}")
+                    outbound.send_message(master_user['telegram_id'], notify_text)
     
     await clear_state_preserve_sticker(state)
 
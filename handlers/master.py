@@ -266,7 +266,7 @@ async def master_toggle_category_selection(callback: CallbackQuery, state: FSMCo
         
     await state.update_data(selected_category_ids=selected_ids)
     
-    cat = await db.get_category(cat_id)
+    cat = globals.cache_service.get_category(cat_id)
     parent_id = cat['parent_id'] if cat else None
     
     markup = await get_categories_keyboard_v2(parent_id=parent_id, selected_ids=selected_ids, lang=lang)
@@ -330,7 +330,7 @@ async def master_reg_description(message: Message, state: FSMContext, user: dict
     selected_category_ids = data.get("selected_categories", [])
     categories = []
     for cid in selected_category_ids:
-        cat = await db.get_category(cid)
+        cat = globals.cache_service.get_category(cid)
         if cat:
             categories.append(get_category_name(cat['key_field'], lang))
 
@@ -549,7 +549,7 @@ async def master_edit_description(message: Message, state: FSMContext, user: dic
     selected_category_ids = data.get("selected_categories", [])
     categories = []
     for cid in selected_category_ids:
-        cat = await db.get_category(cid)
+        cat = globals.cache_service.get_category(cid)
         if cat:
             categories.append(get_category_name(cat['key_field'], lang))
 
@@ -17,6 +17,7 @@ from services.stickers import replace_sticker, StickerEvent, clear_state_preserv
 
 db = globals.get_db()
 bot = globals.get_bot()
+outbound = globals.get_outbound()
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -131,24 +132,12 @@ async def process_premium_payment_proof(message: Message, state: FSMContext, use
                        user_id=user['id'], 
                        phone=master['phone'])
 
+    # Fan out via the shared sender - the user doesn't wait for N admin sends
     for admin_id in ADMIN_IDS:
-        try:
-            if is_photo:
-                await bot.send_photo(
-                    admin_id,
-                    file_id,
-                    caption=caption,
-                    parse_mode="HTML"
-                )
-            else:
-                await bot.send_document(
-                    admin_id,
-                    file_id,
-                    caption=caption,
-                    parse_mode="HTML"
-                )
-        except Exception:
-            logger.exception(f"Failed to send payment proof to admin {admin_id}")
+        if is_photo:
+            outbound.send_photo(admin_id, file_id, caption=caption, parse_mode="HTML")
+        else:
+            outbound.send_document(admin_id, file_id, caption=caption, parse_mode="HTML")
 
     await message.answer(get_text("premium_screenshot_sent", lang))
     
@@ -62,8 +62,9 @@ async def get_categories_keyboard_v2(parent_id: int = None, selected_ids: list =
     if selected_ids is None:
         selected_ids = []
     
-    db = globals.get_db()
-    categories = await db.get_categories(parent_id)
+    # Category tree is held in memory by CacheService - no DB round trips here
+    cache = globals.cache_service
+    categories = cache.get_categories(parent_id)
     
     buttons = []
     for cat in categories:
@@ -99,7 +100,7 @@ async def get_categories_keyboard_v2(parent_id: int = None, selected_ids: list =
     if parent_id is None:
         bottom_row.append(InlineKeyboardButton(text=get_text("btn_back", lang), callback_data="back_main_menu"))
     else:
-        parent_cat = await db.get_category(parent_id)
+        parent_cat = cache.get_category(parent_id)
         if parent_cat and parent_cat['parent_id']:
             back_data = f"cat_{parent_cat['parent_id']}"
         else:
@@ -523,22 +524,26 @@ def get_orders_menu_keyboard(active_orders: list, has_completed_history: bool, l
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_orders_history_keyboard(page: int, total_pages: int, lang: str = "ru", back_callback: str = "menu_my_orders"):
-    """Keyboard for order history with pagination"""
+def get_orders_history_keyboard(page: int, total_pages: int, lang: str = "ru", back_callback: str = "menu_my_orders",
+                                first_id: int = None, last_id: int = None, has_prev: bool = False, has_next: bool = False):
+    """
+    Keyboard for order history with keyset pagination:
+    prev/next carry the boundary order id of the current page plus the target page number
+    """
     buttons = []
     
     # Pagination row
-    if total_pages > 1:
+    if has_prev or has_next:
         pagination_row = []
-        if page > 0:
-            pagination_row.append(InlineKeyboardButton(text="⬅️", callback_data=f"orders_history_page_{page-1}"))
+        if has_prev:
+            pagination_row.append(InlineKeyboardButton(text="⬅️", callback_data=f"orders_history_prev_{first_id}_{max(page - 1, 0)}"))
         else:
             pagination_row.append(InlineKeyboardButton(text=" ", callback_data="noop"))
         
-        pagination_row.append(InlineKeyboardButton(text=f"📄 {page + 1}/{total_pages}", callback_data="noop"))
+        pagination_row.append(InlineKeyboardButton(text=f"📄 {page + 1}/{max(total_pages, page + 1)}", callback_data="noop"))
         
-        if page < total_pages - 1:
-            pagination_row.append(InlineKeyboardButton(text="➡️", callback_data=f"orders_history_page_{page+1}"))
+        if has_next:
+            pagination_row.append(InlineKeyboardButton(text="➡️", callback_data=f"orders_history_next_{last_id}_{page+1}"))
         else:
             pagination_row.append(InlineKeyboardButton(text=" ", callback_data="noop"))
         
@@ -8,45 +8,31 @@ from contextlib import asynccontextmanager
 from typing import Optional
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 
 from aiogram import Dispatcher, Bot
 from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
 from aiogram.types import Update, BotCommand, BotCommandScopeDefault
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from middlewares.order_check import OrderCheckMiddleware
+from middlewares.db_scope import DbScopeMiddleware
+from middlewares.metrics import HandlerMetricsMiddleware, HandlerNameMiddleware
 
 from config import BOT_TOKEN, WEBHOOK_URL, ADMIN_IDS, PORT
 import config
 from database import Database
 from services.user_service import init_user_service
 from services.cache_service import CacheService
+from services.update_queue import UpdateQueue
+from services.outbound import OutboundSender
+from services.premium_expiry import PremiumExpiryScheduler
+from services.startup import StartupTimer, load_reference_data, sync_config
+from services import metrics
 import globals  # Import globals FIRST (before handlers)
 
-async def sync_config_with_db(db: Database):
-    """Synchronize config.py variables with current database state"""
-    try:
-        # Load Districts
-        dists = await db.get_districts()
-        if dists:
-            config.DISTRICTS[:] = [d['key_field'] for d in dists]
-            
-        # Load Categories (All categories for general key access)
-        all_cats = await db.get_all_categories()
-        if all_cats:
-            config.CATEGORIES[:] = [c['key_field'] for c in all_cats]
-            
-            # CATEGORY_GROUPS is now legacy but we can populate it with root parents for safety
-            config.CATEGORY_GROUPS.clear()
-            roots = [c for c in all_cats if c['parent_id'] is None]
-            for r in roots:
-                config.CATEGORY_GROUPS[r['key_field']] = [] # Empty list as we use dynamic navigation
-                
-        logger.info(f"⚙️ Config synced with DB: {len(config.CATEGORIES)} categories, {len(config.DISTRICTS)} districts")
-    except Exception as e:
-        logger.error(f"❌ Failed to sync config with DB: {e}")
-
 # ====== Logging ======
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -56,72 +42,162 @@ storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
 # Register Middlewares
+# Outer: one DB connection + read memo per update (wraps all other middlewares)
+dp.update.outer_middleware(DbScopeMiddleware())
+# Per-handler latency/errors for /metrics (outer times, inner names the matched handler)
+dp.message.outer_middleware(HandlerMetricsMiddleware())
+dp.callback_query.outer_middleware(HandlerMetricsMiddleware())
+dp.message.middleware(HandlerNameMiddleware())
+dp.callback_query.middleware(HandlerNameMiddleware())
 dp.message.middleware(OrderCheckMiddleware())
 dp.callback_query.middleware(OrderCheckMiddleware())
 
 # ====== FastAPI app (for Render webhook) ======
 app = FastAPI(title="Mersin Masters Bot")
 
+# Async webhook ingestion (WEBHOOK_ASYNC=true), started in lifespan
+update_queue: Optional[UpdateQueue] = None
+
+# Premium expiry scheduler (PREMIUM_EXPIRY_ENABLED), started in startup()
+premium_expiry: Optional[PremiumExpiryScheduler] = None
+
+async def process_update(update: Update):
+    await dp.feed_update(globals.bot, update)
+
+def create_outbound_sender() -> OutboundSender:
+    return OutboundSender(
+        workers=config.OUTBOUND_WORKERS,
+        global_rate=config.OUTBOUND_GLOBAL_RATE,
+        per_chat_interval=config.OUTBOUND_PER_CHAT_INTERVAL,
+        max_retries=config.OUTBOUND_MAX_RETRIES,
+    )
+
+# ====== Startup ======
+BOT_COMMANDS = [
+    BotCommand(command="start", description="Запуск / Başla"),
+    BotCommand(command="profile", description="Профиль / Profil"),
+    BotCommand(command="lang", description="Язык / Dil"),
+]
+
+# Per-phase timings of the last startup (see /dev/startup)
+startup_timer: Optional[StartupTimer] = None
+
+async def setup_bot_api(timer: StartupTimer, use_webhook: bool):
+    """Bot API calls that don't depend on DB - run concurrently with DB init"""
+    async def set_commands():
+        async with timer.phase("set_my_commands"):
+            await globals.bot.set_my_commands(BOT_COMMANDS, scope=BotCommandScopeDefault())
+
+    async def set_webhook():
+        async with timer.phase("webhook"):
+            if not use_webhook:
+                # Ensure webhook is removed
+                await globals.bot.delete_webhook(drop_pending_updates=True)
+                logger.info("🗑️ Webhook removed")
+            elif WEBHOOK_URL:
+                try:
+                    await globals.bot.set_webhook(
+                        url=f"{WEBHOOK_URL}/webhook",
+                        allowed_updates=["message", "callback_query", "my_chat_member"]
+                    )
+                    logger.info(f"✅ Webhook set: {WEBHOOK_URL}/webhook")
+                except Exception as e:
+                    logger.error(f"❌ Webhook error: {e}")
+            else:
+                logger.info("⚠️  WEBHOOK_URL not set, using polling (for local dev)")
+
+    await asyncio.gather(set_commands(), set_webhook())
+
+async def load_reference_caches(timer: StartupTimer):
+    """Fetch categories/districts once, feed config.* and CacheService"""
+    async with timer.phase("reference_data"):
+        categories, districts, adjacency = await load_reference_data(globals.db)
+        sync_config(categories, districts)
+        globals.cache_service = CacheService()
+        await globals.cache_service.load(globals.db, categories, districts, adjacency)
+
+async def warm_up_db(timer: StartupTimer):
+    async with timer.phase("db_warm_up"):
+        await globals.db.warm_up()
+
+async def startup(use_webhook: bool, db: Database = None, bot_session: BaseSession = None):
+    """
+    Initialize globals, caches and Bot API settings; independent steps run concurrently.
+    db / bot_session let benchmarks inject an instrumented pool and a stubbed Bot API.
+    """
+    global startup_timer, premium_expiry
+    timer = StartupTimer()
+
+    # Initialize bot
+    globals.bot = Bot(token=BOT_TOKEN, session=bot_session, default=DefaultBotProperties(parse_mode='HTML'))
+    bot_api = asyncio.create_task(setup_bot_api(timer, use_webhook))
+
+    try:
+        # Initialize database (connect + migrations)
+        async with timer.phase("db_init"):
+            globals.db = db or Database(config.DATABASE_URL)
+            await globals.db.init(warm_up=False)
+
+        # Initialize user service
+        globals.user_service = init_user_service(globals.db)
+
+        await asyncio.gather(load_reference_caches(timer), warm_up_db(timer))
+        await bot_api
+    except BaseException:
+        bot_api.cancel()
+        raise
+
+    # Initialize shared outbound sender (rate-limited notifications)
+    globals.outbound = create_outbound_sender()
+    globals.outbound.start()
+
+    # Downgrade expired premium masters in the background (leader-locked across replicas)
+    if config.PREMIUM_EXPIRY_ENABLED:
+        premium_expiry = PremiumExpiryScheduler(
+            globals.db,
+            globals.outbound,
+            interval=config.PREMIUM_EXPIRY_INTERVAL,
+            batch_size=config.PREMIUM_EXPIRY_BATCH_SIZE,
+        )
+        premium_expiry.start()
+
+    # NOW import handlers (after globals initialized)
+    async with timer.phase("handlers"):
+        from handlers import client, master, add_master, admin, payments, premium
+
+        # Register handlers
+        dp.include_router(client.router)
+        dp.include_router(master.router)
+        dp.include_router(add_master.router)
+        dp.include_router(admin.router)
+        dp.include_router(payments.router)
+        dp.include_router(premium.router)
+
+    timer.report()
+    startup_timer = timer
+
 # ====== Startup/Shutdown ======
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup & shutdown events"""
     # Startup
     logger.info("🚀 Bot starting...")
-    
-    # Initialize database (async init)
-    globals.db = Database(config.DATABASE_URL)
-    await globals.db.init()
-    
-    # Initialize user service
-    globals.user_service = init_user_service(globals.db)
-    
-    # Sync config with database data
-    await sync_config_with_db(globals.db)
-    
-    # Initialize cache service
-    globals.cache_service = CacheService()
-    await globals.cache_service.load(globals.db)
-    
-    # Initialize bot
-    globals.bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
-    
-    # NOW import handlers (after globals initialized)
-    from handlers import client, master, add_master, admin, payments, premium
-    
-    # Register handlers
-    dp.include_router(client.router)
-    dp.include_router(master.router)
-    dp.include_router(add_master.router)
-    dp.include_router(admin.router)
-    dp.include_router(payments.router)
-    dp.include_router(premium.router)
-    
-    # Set bot commands
-    commands = [
-        BotCommand(command="start", description="Запуск / Başla"),
-        BotCommand(command="profile", description="Профиль / Profil"),
-        BotCommand(command="lang", description="Язык / Dil"),
-    ]
-    await globals.bot.set_my_commands(commands, scope=BotCommandScopeDefault())
-    
-    # Set webhook (if WEBHOOK_URL is set)
-    if WEBHOOK_URL:
-        try:
-            await globals.bot.set_webhook(
-                url=f"{WEBHOOK_URL}/webhook",
-                allowed_updates=["message", "callback_query", "my_chat_member"]
-            )
-            logger.info(f"✅ Webhook set: {WEBHOOK_URL}/webhook")
-        except Exception as e:
-            logger.error(f"❌ Webhook error: {e}")
-    else:
-        logger.info("⚠️  WEBHOOK_URL not set, using polling (for local dev)")
+    await startup(use_webhook=True)
+
+    global update_queue
+    if config.WEBHOOK_ASYNC:
+        update_queue = UpdateQueue(process_update, workers=config.UPDATE_WORKERS, max_size=config.UPDATE_QUEUE_MAX_SIZE)
+        update_queue.start()
     
     yield
     
     # Shutdown
     logger.info("🛑 Bot shutting down...")
+    if update_queue:
+        await update_queue.stop()
+    if premium_expiry:
+        await premium_expiry.stop()
+    await globals.outbound.stop()
     await globals.bot.session.close()
     await globals.db.close()
 
@@ -134,7 +210,14 @@ async def webhook(request: Request):
     try:
         update_data = await request.json()
         update = Update(**update_data)
-        await dp.feed_update(globals.bot, update)
+        if update_queue:
+            # Ack now, process in the worker pool
+            if not update_queue.submit(update):
+                logger.warning(f"⚠️ Update queue full, rejecting update {update.update_id}")
+                # Non-2xx makes Telegram redeliver later
+                return JSONResponse(status_code=503, content={"ok": False, "error": "queue full"})
+            return {"ok": True}
+        await process_update(update)
         return {"ok": True}
     except Exception as e:
         logger.error(f"❌ Webhook error: {e}")
@@ -146,29 +229,151 @@ async def health_check():
     """Health check for UptimeRobot"""
     return {"status": "ok"}
 
+# ====== Metrics (Prometheus text format) ======
+def _cache_samples(name: str, cache) -> list:
+    if cache is None:
+        return []
+    total = cache.hits + cache.misses
+    return [
+        ({"cache": name, "stat": "hits"}, cache.hits),
+        ({"cache": name, "stat": "misses"}, cache.misses),
+        ({"cache": name, "stat": "entries"}, len(cache.cache)),
+        ({"cache": name, "stat": "hit_rate"}, round(cache.hits / total, 4) if total else 0.0),
+    ]
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Handler latency/errors, DB pool, cache and queue gauges"""
+    lines = metrics.HANDLER_LATENCY.render() + metrics.HANDLER_ERRORS.render()
+
+    db = globals.db
+    pool = db.pool if db else None
+    if pool:
+        lines += metrics.render_gauge("bot_db_pool_connections", "asyncpg pool connections", [
+            ({"state": "total"}, pool.get_size()),
+            ({"state": "idle"}, pool.get_idle_size()),
+            ({"state": "max"}, pool.get_max_size()),
+        ])
+
+    if db and db.query_stats:
+        summary = db.query_stats.summary()
+        lines += metrics.render_gauge("bot_db_queries", "Query counters from Database._run", [
+            ({"stat": key}, summary[key])
+            for key in ("calls", "memo_hits", "slow_queries", "updates", "queries_per_update", "max_queries_per_update")
+        ])
+
+    cache_samples = []
+    if db:
+        cache_samples += _cache_samples("users", db.cache)
+        cache_samples += _cache_samples("pending_orders", db.pending_orders)
+        cache_samples += _cache_samples("search_results", db.search_cache)
+        cache_samples += _cache_samples("master_cards", db.master_cards)
+    lines += metrics.render_gauge("bot_cache", "In-process cache counters and hit rate", cache_samples)
+
+    if db and db.search_index:
+        lines += metrics.render_gauge("bot_search_index_masters", "Masters in the search index", [
+            ({}, len(db.search_index.masters)),
+        ])
+
+    queue_samples = []
+    if update_queue:
+        stats = update_queue.stats()
+        for key in ("depth", "busy_workers", "utilization", "received", "processed", "failed", "dropped"):
+            queue_samples.append(({"queue": "updates", "stat": key}, stats[key]))
+    if globals.outbound:
+        stats = globals.outbound.stats()
+        for key in ("queued", "sent", "failed", "retried", "throughput_per_sec"):
+            queue_samples.append(({"queue": "outbound", "stat": key}, stats[key]))
+    lines += metrics.render_gauge("bot_queue", "Update ingestion and outbound sender queues", queue_samples)
+
+    if premium_expiry:
+        stats = premium_expiry.stats()
+        lines += metrics.render_gauge("bot_premium_expiry", "Premium expiry scheduler counters", [
+            ({"stat": key}, stats[key]) for key in ("runs", "skipped", "expired", "notified", "failed")
+        ])
+
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+# ====== Dev stats (Update queue) ======
+@app.get("/dev/queue")
+async def dev_queue_stats():
+    """Webhook ingestion queue depth, worker utilization and drop counters"""
+    if not update_queue:
+        return {"enabled": False}
+    return {"enabled": True, **update_queue.stats()}
+
+# ====== Dev stats (DB queries) ======
+@app.get("/dev/queries")
+async def dev_query_stats(limit: int = 20, sort: str = "total_ms", reset: bool = False):
+    """Top query shapes by total/avg/max time, calls or rows; ?reset=true clears counters"""
+    stats = globals.db.query_stats if globals.db else None
+    if not stats:
+        return {"enabled": False}
+    result = {"enabled": True, **stats.summary(), "top": stats.top(limit, sort)}
+    if reset:
+        stats.reset()
+    return result
+
+# ====== Dev stats (Startup) ======
+@app.get("/dev/startup")
+async def dev_startup_stats():
+    """Per-phase timings of the last startup"""
+    if not startup_timer:
+        return {"started": False}
+    return {"started": True, **startup_timer.stats()}
+
+# ====== Dev stats (Outbound sender) ======
+@app.get("/dev/outbound")
+async def dev_outbound_stats():
+    """Outbound notification throughput, retries and backlog"""
+    if not globals.outbound:
+        return {"enabled": False}
+    return {"enabled": True, **globals.outbound.stats()}
+
+# ====== Dev stats (Premium expiry) ======
+@app.get("/dev/premium-expiry")
+async def dev_premium_expiry_stats():
+    """Premium expiry runs, downgrades and notifications"""
+    if not premium_expiry:
+        return {"enabled": False}
+    return {"enabled": True, **premium_expiry.stats()}
+
 # ====== Dev stats (Memory) ======
 @app.get("/dev")
 async def dev_stats():
-    """Hook for memory diagnostics"""
-    from utils.memory_utils import get_size, get_process_memory
+    """Hook for memory diagnostics (O(1) counters maintained by the caches)"""
     import psutil
     import os
 
-    # Measure caches
-    cat_size = 0
-    dist_size = 0
-    user_cache_size = 0
     process = psutil.Process(os.getpid())
+    cat_size = dist_size = 0
+    user_cache_size = user_cache_entries = 0
+    pending_size = pending_entries = 0
+    search_size = search_entries = 0
+    card_size = card_entries = 0
 
     if globals.cache_service:
-        cat_size = get_size(globals.cache_service.categories)
-        dist_size = get_size(globals.cache_service.districts)
-        
-    if globals.db and hasattr(globals.db, 'cache'):
-        user_cache_size = get_size(globals.db.cache.cache)
-    
-    total_cache_kb = (cat_size + dist_size + user_cache_size) / 1024
-    
+        cat_size = globals.cache_service.categories_bytes
+        dist_size = globals.cache_service.districts_bytes
+
+    if globals.db and globals.db.cache:
+        user_cache_size = globals.db.cache.bytes
+        user_cache_entries = len(globals.db.cache.cache)
+
+    if globals.db and globals.db.pending_orders:
+        pending_size = globals.db.pending_orders.bytes
+        pending_entries = len(globals.db.pending_orders.cache)
+
+    if globals.db and globals.db.search_cache:
+        search_size = globals.db.search_cache.bytes
+        search_entries = len(globals.db.search_cache.cache)
+
+    if globals.db and globals.db.master_cards:
+        card_size = globals.db.master_cards.bytes
+        card_entries = len(globals.db.master_cards.cache)
+
+    total_cache_kb = (cat_size + dist_size + user_cache_size + pending_size + search_size + card_size) / 1024
+
     return {
         "cache_memory_kb": round(total_cache_kb, 2),
         "process_memory": f"RAM: {process.memory_info().rss / 1024**2:.1f} MB",
@@ -176,58 +381,53 @@ async def dev_stats():
         "details": {
             "categories_cache_kb": round(cat_size / 1024, 2),
             "districts_cache_kb": round(dist_size / 1024, 2),
-            "user_cache_kb": round(user_cache_size / 1024, 2)
+            "user_cache_kb": round(user_cache_size / 1024, 2),
+            "user_cache_entries": user_cache_entries,
+            "pending_orders_cache_kb": round(pending_size / 1024, 2),
+            "pending_orders_cache_entries": pending_entries,
+            "search_cache_kb": round(search_size / 1024, 2),
+            "search_cache_entries": search_entries,
+            "master_cards_cache_kb": round(card_size / 1024, 2),
+            "master_cards_cache_entries": card_entries,
         }
     }
 
+# ====== Dev stats (tracemalloc) ======
+@app.post("/dev/tracemalloc/start")
+async def dev_tracemalloc_start(frames: int = 1):
+    """Start tracing allocations (adds overhead - stop when done)"""
+    from utils.memory_utils import tracemalloc_start
+    return tracemalloc_start(frames)
+
+@app.post("/dev/tracemalloc/stop")
+async def dev_tracemalloc_stop():
+    from utils.memory_utils import tracemalloc_stop
+    return tracemalloc_stop()
+
+@app.post("/dev/tracemalloc/snapshot")
+async def dev_tracemalloc_snapshot(limit: int = 20, key: str = "lineno"):
+    """Store a baseline snapshot; returns top allocations (key: lineno or filename)"""
+    from utils.memory_utils import tracemalloc_snapshot
+    return await asyncio.to_thread(tracemalloc_snapshot, limit, key)
+
+@app.get("/dev/tracemalloc/diff")
+async def dev_tracemalloc_diff(limit: int = 20, key: str = "lineno"):
+    """Top-N growth since the baseline snapshot"""
+    from utils.memory_utils import tracemalloc_diff
+    return await asyncio.to_thread(tracemalloc_diff, limit, key)
+
 # ====== Local polling (for development) ======
 async def run_polling():
     """Run bot with long polling (for local testing)"""
     logger.info("🚀 Bot starting (polling mode)...")
-    
-    # Initialize database (async init)
-    globals.db = Database(config.DATABASE_URL)
-    await globals.db.init()
-    
-    # Initialize user service
-    globals.user_service = init_user_service(globals.db)
-    
-    # Sync config with database data
-    await sync_config_with_db(globals.db)
-    
-    # Initialize cache service
-    globals.cache_service = CacheService()
-    await globals.cache_service.load(globals.db)
-    
-    # Initialize bot
-    globals.bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
-    
-    # NOW import handlers (after globals initialized)
-    from handlers import client, master, add_master, admin, payments, premium
-    
-    # Register handlers
-    dp.include_router(client.router)
-    dp.include_router(master.router)
-    dp.include_router(add_master.router)
-    dp.include_router(admin.router)
-    dp.include_router(payments.router)
-    dp.include_router(premium.router)
-    
-    # Set bot commands
-    commands = [
-        BotCommand(command="start", description="Запуск / Başla"),
-        BotCommand(command="profile", description="Профиль / Profil"),
-        BotCommand(command="lang", description="Язык / Dil"),
-    ]
-    await globals.bot.set_my_commands(commands, scope=BotCommandScopeDefault())
-    
-    # Ensure webhook is removed
-    await globals.bot.delete_webhook(drop_pending_updates=True)
-    logger.info("🗑️ Webhook removed")
+    await startup(use_webhook=False)
 
     try:
         await dp.start_polling(globals.bot)
     finally:
+        if premium_expiry:
+            await premium_expiry.stop()
+        await globals.outbound.stop()
         await globals.bot.session.close()
         await globals.db.close()
 
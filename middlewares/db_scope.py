@@ -0,0 +1,25 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import globals
+
+
+class DbScopeMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: Database calls made while handling one update share
+    a memo of identical read queries, and back-to-back calls share one pooled
+    connection (released whenever the handler awaits something else).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if globals.db is None:
+            return await handler(event, data)
+
+        async with globals.db.request_scope():
+            return await handler(event, data)
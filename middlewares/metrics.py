@@ -0,0 +1,82 @@
+import re
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery, TelegramObject
+
+from services.metrics import HANDLER_LATENCY, HANDLER_ERRORS
+
+# Trailing ids: "order_start_12" -> "order_start", "rating_12_5" -> "rating"
+_ID_SUFFIX_RE = re.compile(r"(_-?\d+)+$")
+# Callback data is client-controlled - cap the label set
+MAX_PREFIXES = 200
+_known_prefixes = set()
+
+
+def callback_prefix(data: str) -> str:
+    if not data:
+        return "empty"
+    prefix = _ID_SUFFIX_RE.sub("", data) or "numeric"
+    if prefix not in _known_prefixes:
+        if len(_known_prefixes) >= MAX_PREFIXES:
+            return "other"
+        _known_prefixes.add(prefix)
+    return prefix
+
+
+def message_prefix(message: Message) -> str:
+    text = message.text or ""
+    if text.startswith("/"):
+        return text.split()[0].split("@")[0][:32]
+    return str(message.content_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Outer message/callback middleware: latency histogram and error counter
+    per handler and callback-data prefix (exported by /metrics).
+
+    The handler is only resolved inside the observer, so HandlerNameMiddleware
+    (inner) reports it back through a holder placed in data.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, CallbackQuery):
+            event_type, prefix = "callback_query", callback_prefix(event.data)
+        elif isinstance(event, Message):
+            event_type, prefix = "message", message_prefix(event)
+        else:
+            return await handler(event, data)
+
+        holder = {"handler": "unhandled"}
+        data["metrics_holder"] = holder
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(event=event_type, handler=holder["handler"], prefix=prefix, error=type(e).__name__)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, event=event_type, handler=holder["handler"], prefix=prefix)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner middleware: records which handler matched the event"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        holder = data.get("metrics_holder")
+        handler_object = data.get("handler")
+        if holder is not None and handler_object is not None:
+            holder["handler"] = getattr(handler_object.callback, "__name__", "unknown")
+        return await handler(event, data)
@@ -62,6 +62,7 @@ class OrderCheckMiddleware(BaseMiddleware):
             # New user, no orders
             return await handler(event, data)
             
+        # Cached verdict - normally no DB query (see PendingOrderCache)
         pending_order = await db.get_client_pending_order(user['id'])
         
         if pending_order:
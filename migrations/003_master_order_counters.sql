@@ -0,0 +1,20 @@
+-- Denormalized order counters on masters (maintained by Database.complete_order)
+ALTER TABLE masters ADD COLUMN IF NOT EXISTS completed_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE masters ADD COLUMN IF NOT EXISTS rated_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE masters ADD COLUMN IF NOT EXISTS satisfied_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from order history
+UPDATE masters m SET
+    completed_count = s.completed_count,
+    rated_count = s.rated_count,
+    satisfied_count = s.satisfied_count
+FROM (
+    SELECT master_id,
+           COUNT(*) AS completed_count,
+           COUNT(rating) AS rated_count,
+           COUNT(*) FILTER (WHERE rating >= 4) AS satisfied_count
+    FROM orders
+    WHERE status = 'completed'
+    GROUP BY master_id
+) s
+WHERE s.master_id = m.id;
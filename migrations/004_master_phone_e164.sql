@@ -0,0 +1,8 @@
+-- Canonical E.164 phone for duplicate checks (one index probe instead of phone = ANY(variants)).
+-- Written by the application with utils.phone_utils.to_e164 on insert/update (NULL if not E.164);
+-- historical rows are filled once by migration 011.
+-- Not UNIQUE yet: duplicates are logged when 011 applies (Database.report_duplicate_phones)
+-- and must be merged first.
+ALTER TABLE masters ADD COLUMN IF NOT EXISTS phone_e164 TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_masters_phone_e164 ON masters(phone_e164);
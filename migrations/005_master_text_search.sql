@@ -0,0 +1,7 @@
+-- Free-text master search (Database.search_masters_text): trigram GIN index serves
+-- "(name || ' ' || coalesce(description, '')) ILIKE '%term%'" for any language/substring.
+-- Built CONCURRENTLY so existing masters stay writable (runs outside a transaction).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_masters_text_trgm
+    ON masters USING gin ((name || ' ' || coalesce(description, '')) gin_trgm_ops);
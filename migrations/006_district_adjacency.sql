@@ -0,0 +1,31 @@
+-- District adjacency graph for the "nearby districts" search fallback.
+-- Undirected edges are stored in both directions; rings (1 = neighbor, 2 = neighbor's
+-- neighbor, ...) are computed from it at startup by CacheService.
+CREATE TABLE IF NOT EXISTS district_adjacency (
+    district_id  INTEGER REFERENCES districts(id) ON DELETE CASCADE,
+    neighbor_id  INTEGER REFERENCES districts(id) ON DELETE CASCADE,
+    PRIMARY KEY (district_id, neighbor_id),
+    CHECK (district_id <> neighbor_id)
+);
+
+-- Coast west -> east: aydincik - tashucu - silifke - erdemli - tece - mezitli - yenisehir - akdeniz;
+-- inland: mut (north of silifke), toroslar (north of mezitli/yenisehir/akdeniz)
+INSERT INTO district_adjacency (district_id, neighbor_id)
+SELECT a.id, b.id
+FROM (VALUES
+    ('aydincik', 'tashucu'),
+    ('tashucu', 'silifke'),
+    ('silifke', 'mut'),
+    ('silifke', 'erdemli'),
+    ('erdemli', 'tece'),
+    ('tece', 'mezitli'),
+    ('mezitli', 'yenisehir'),
+    ('mezitli', 'toroslar'),
+    ('yenisehir', 'akdeniz'),
+    ('yenisehir', 'toroslar'),
+    ('akdeniz', 'toroslar')
+) AS e(k1, k2)
+CROSS JOIN LATERAL (VALUES (e.k1, e.k2), (e.k2, e.k1)) AS d(src, dst)
+JOIN districts a ON a.key_field = d.src
+JOIN districts b ON b.key_field = d.dst
+ON CONFLICT DO NOTHING;
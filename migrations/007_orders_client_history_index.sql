@@ -0,0 +1,8 @@
+-- Keyset pagination of a client's order history (Database.get_completed_orders_page):
+-- equality on (client_id, status), then a range scan on (created_at, id).
+-- Also makes the per-client active/completed counts index-only.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_client_status_created
+    ON orders(client_id, status, created_at, id);
+
+-- Prefix of the index above
+DROP INDEX CONCURRENTLY IF EXISTS idx_orders_client_status;
@@ -0,0 +1,14 @@
+-- Partial/covering indexes for the client rating predicates (verify with benchmarks/verify_index_plans.py).
+-- The hot master and client order predicates are already covered by
+-- idx_orders_client_status_created (007) and idx_orders_master_reviews (009).
+-- Built CONCURRENTLY so the orders table stays writable.
+
+-- Reviews a client left: get_client_reviews_for_masters
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_client_rated
+    ON orders(client_id, completed_at DESC)
+    WHERE rating IS NOT NULL;
+
+-- Ratings a client received: update_client_rating (AVG(client_rating) index-only)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_client_rating_received
+    ON orders(client_id) INCLUDE (client_rating)
+    WHERE client_rating IS NOT NULL;
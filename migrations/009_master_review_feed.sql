@@ -0,0 +1,9 @@
+-- Master review feed (Database.get_master_review_page): completed orders with a rating
+-- or text, newest first, keyset-paginated on (completed_at, id).
+
+-- Keyset comparisons skip NULLs; completed_at has been set by complete_order, this covers older rows
+UPDATE orders SET completed_at = created_at WHERE status = 'completed' AND completed_at IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_master_reviews
+    ON orders(master_id, completed_at DESC, id DESC)
+    WHERE status = 'completed' AND (rating IS NOT NULL OR review_text IS NOT NULL);
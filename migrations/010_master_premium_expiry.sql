@@ -0,0 +1,5 @@
+-- Premium expiry scan (Database.expire_premium): only premium masters, ordered by expiry,
+-- so each tick reads just the rows that are due. Built CONCURRENTLY so masters stays writable.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_masters_premium_until
+    ON masters(premium_until)
+    WHERE status = 'active_premium';
@@ -0,0 +1,27 @@
+-- One-time phone_e164 backfill (replaces the per-startup scan in Database.init).
+-- Mirrors utils.phone_utils.normalize_phone, keeping only E.164 results:
+-- bare-digit fallbacks written by earlier versions are reset to NULL.
+UPDATE masters m
+SET phone_e164 = n.e164
+FROM (
+    SELECT id,
+           CASE
+               WHEN d = '' THEN NULL
+               WHEN length(d) = 10 AND d LIKE '5%' THEN '+90' || d
+               WHEN length(d) = 11 AND d LIKE '05%' THEN '+90' || substr(d, 2)
+               WHEN length(d) = 12 AND d LIKE '905%' THEN '+' || d
+               WHEN length(d) = 13 AND d LIKE '905%' THEN '+' || substr(d, 2)
+               WHEN length(d) = 11 AND d LIKE '7%' THEN '+' || d
+               WHEN length(d) = 11 AND d LIKE '8%' THEN '+7' || substr(d, 2)
+               WHEN NOT plus AND length(d) >= 10 AND d NOT LIKE '0%' THEN '+' || d
+               WHEN plus THEN '+' || d
+           END AS e164
+    FROM (
+        SELECT id,
+               regexp_replace(coalesce(phone, ''), '\D', '', 'g') AS d,
+               coalesce(phone, '') ~ '^\s*\+' AS plus
+        FROM masters
+    ) p
+) n
+WHERE m.id = n.id
+  AND m.phone_e164 IS DISTINCT FROM n.e164;
@@ -1,61 +1,205 @@
+from bisect import bisect_left
+
+from config import SUPPORTED_LANGUAGES
+from services.search_service import tokenize, MIN_TERM_LENGTH
 from utils.i18n import get_category_name, get_district_name
+from utils.memory_utils import get_size
 
 class CacheService:
     def __init__(self):
-        # ID -> { 'key': str, 'names': {lang: str} }
+        # ID -> { 'key': str, 'short_key': str, 'parent_id': int, 'children': [ID], 'names': {lang: str} }
         self.categories = {}
         self.districts = {}
-        
+
         # Key -> ID
         self.cat_key_to_id = {}
         self.dist_key_to_id = {}
 
-    async def load(self, db):
-        """Load all categories and districts from DB into memory"""
+        # Root category IDs (parent_id IS NULL), ordered by key
+        self.root_category_ids = []
+
+        # Free-text search over localized category names (all languages):
+        # word -> category IDs, plus the sorted words for prefix lookups
+        self.category_words = {}
+        self._sorted_category_words = []
+
+        # District graph: ID -> neighbor IDs, and precomputed hop distances ID -> {ID: hops}
+        self.district_neighbors = {}
+        self.district_hops = {}
+
+        # Measured once per load - the data is static afterwards (see /dev)
+        self.categories_bytes = 0
+        self.districts_bytes = 0
+
+    async def load(self, db, all_cats: list = None, all_dists: list = None, adjacency: list = None):
+        """Load all categories, districts and district adjacency into memory (from DB unless already fetched)"""
         # Load Categories
-        all_cats = await db.get_all_categories()
+        if all_cats is None:
+            all_cats = await db.get_all_categories()
         self.categories = {}
         self.cat_key_to_id = {}
-        
+
         for cat in all_cats:
             c_id = cat['id']
             key = cat['key_field']
             self.categories[c_id] = {
                 'key': key,
-                'names': {
-                    'ru': get_category_name(key, 'ru'),
-                    'tr': get_category_name(key, 'tr')
-                }
+                'short_key': cat.get('short_key_field'),
+                'parent_id': cat['parent_id'],
+                'children': [],
+                'names': {lang: get_category_name(key, lang) for lang in SUPPORTED_LANGUAGES}
             }
             if key:
                 self.cat_key_to_id[key] = c_id
 
+        # Build tree (children ordered by key_field, same as get_categories)
+        self.root_category_ids = []
+        for c_id, cat in sorted(self.categories.items(), key=lambda item: item[1]['key'] or ''):
+            parent = self.categories.get(cat['parent_id'])
+            if cat['parent_id'] is None or parent is None:
+                self.root_category_ids.append(c_id)
+            else:
+                parent['children'].append(c_id)
+
+        self._build_category_words()
+
         # Load Districts
-        all_dists = await db.get_districts()
+        if all_dists is None:
+            all_dists = await db.get_districts()
         self.districts = {}
         self.dist_key_to_id = {}
-        
+
         for dist in all_dists:
             d_id = dist['id']
             key = dist['key_field']
             self.districts[d_id] = {
                 'key': key,
-                'names': {
-                    'ru': get_district_name(key, 'ru'),
-                    'tr': get_district_name(key, 'tr')
-                }
+                'names': {lang: get_district_name(key, lang) for lang in SUPPORTED_LANGUAGES}
             }
             if key:
                 self.dist_key_to_id[key] = d_id
-                
+
+        if adjacency is None:
+            adjacency = await db.get_district_adjacency()
+        self._build_district_graph(adjacency)
+
+        self.categories_bytes = get_size(self.categories)
+        self.districts_bytes = get_size(self.districts)
+
         print(f"Cache loaded: {len(self.categories)} categories, {len(self.districts)} districts")
 
+    def _build_category_words(self):
+        words = {}
+        for c_id, cat in self.categories.items():
+            for name in cat['names'].values():
+                if name.startswith('[category_'):
+                    continue  # missing translation placeholder
+                for word in tokenize(name):
+                    words.setdefault(word, set()).add(c_id)
+        self.category_words = words
+        self._sorted_category_words = sorted(words)
+
+    def _categories_by_prefix(self, prefix: str) -> set:
+        """Categories having a name word that starts with prefix ("кондиционер" -> "кондиционеров")"""
+        found = set()
+        words = self._sorted_category_words
+        i = bisect_left(words, prefix)
+        while i < len(words) and words[i].startswith(prefix):
+            found |= self.category_words[words[i]]
+            i += 1
+        return found
+
+    def match_categories(self, text: str) -> list:
+        """
+        Category IDs whose localized name matches every term of text (ru/tr/en),
+        expanded with their subcategories - masters are linked to leaf categories.
+        """
+        terms = [t for t in tokenize(text) if len(t) >= MIN_TERM_LENGTH]
+        if not terms:
+            return []
+
+        matched = None
+        for term in terms:
+            found = self._categories_by_prefix(term)
+            matched = found if matched is None else matched & found
+            if not matched:
+                return []
+
+        result = set()
+        stack = list(matched)
+        while stack:
+            c_id = stack.pop()
+            if c_id in result:
+                continue
+            result.add(c_id)
+            stack.extend(self.categories[c_id]['children'])
+        return sorted(result)
+
+    def _build_district_graph(self, adjacency: list):
+        neighbors = {d_id: set() for d_id in self.districts}
+        for edge in adjacency:
+            a, b = edge['district_id'], edge['neighbor_id']
+            if a in neighbors and b in neighbors:
+                neighbors[a].add(b)
+                neighbors[b].add(a)
+
+        # BFS from every district - the graph is tiny, lookups at search time are then O(1)
+        hops = {}
+        for start in neighbors:
+            dist = {start: 0}
+            frontier = [start]
+            while frontier:
+                next_frontier = []
+                for d_id in frontier:
+                    for n_id in neighbors[d_id]:
+                        if n_id not in dist:
+                            dist[n_id] = dist[d_id] + 1
+                            next_frontier.append(n_id)
+                frontier = next_frontier
+            hops[start] = dist
+
+        self.district_neighbors = neighbors
+        self.district_hops = hops
+
+    def district_rings(self, district_ids: list, max_ring: int = None) -> dict:
+        """District ID -> ring (0 = selected, 1 = neighbors, ...) for every reachable district"""
+        rings = {}
+        for start in district_ids:
+            for d_id, ring in self.district_hops.get(start, {start: 0}).items():
+                if max_ring is not None and ring > max_ring:
+                    continue
+                if ring < rings.get(d_id, ring + 1):
+                    rings[d_id] = ring
+        return rings
+
     def get_category_id(self, key: str) -> int:
         return self.cat_key_to_id.get(key)
 
     def get_district_id(self, key: str) -> int:
         return self.dist_key_to_id.get(key)
-        
+
+    def get_category(self, cat_id: int) -> dict:
+        """Category row in the same shape as Database.get_categories() returns"""
+        cat = self.categories.get(cat_id)
+        if not cat:
+            return None
+        return {
+            'id': cat_id,
+            'parent_id': cat['parent_id'],
+            'key_field': cat['key'],
+            'short_key_field': cat['short_key'],
+            'child_count': len(cat['children'])
+        }
+
+    def get_categories(self, parent_id: int = None) -> list:
+        """Children of parent_id (roots if None), ordered by key"""
+        if parent_id is None:
+            child_ids = self.root_category_ids
+        else:
+            parent = self.categories.get(parent_id)
+            child_ids = parent['children'] if parent else []
+        return [self.get_category(c_id) for c_id in child_ids]
+
     def get_category_name(self, cat_id: int, lang: str = 'ru') -> str:
         cat = self.categories.get(cat_id)
         if not cat:
@@ -0,0 +1,165 @@
+"""
+Shared outbound Telegram sender.
+
+Handlers enqueue notifications instead of awaiting N serial Bot API calls.
+Workers send concurrently while respecting Telegram limits:
+- global rate (~30 messages/second per bot)
+- per-chat interval (~1 message/second per chat)
+- 429 retry_after: the chat and the global slot are pushed back, job retried
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import globals
+
+logger = logging.getLogger(__name__)
+
+
+def _retrieve_exception(future: asyncio.Future):
+    # Fire-and-forget callers never await; mark the exception as retrieved
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundSender:
+    def __init__(self, workers: int = 8, global_rate: float = 30.0, per_chat_interval: float = 1.0, max_retries: int = 3):
+        self.workers = workers
+        self.global_interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks = []
+
+        # Next free send slot (monotonic time), reserved synchronously by workers
+        self._global_next = 0.0
+        self._chat_next: Dict[int, float] = {}
+
+        # Stats
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._sent_times = deque(maxlen=10000)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"📤 Outbound sender started: {self.workers} workers")
+
+    async def stop(self, timeout: float = 10.0):
+        """Flush queued messages (up to timeout), then stop workers"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbound sender stopped with {self._queue.qsize()} unsent messages")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ===== Public API (non-blocking, return a Future with the API result) =====
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        return self.submit("send_message", chat_id, text, **kwargs)
+
+    def send_photo(self, chat_id: int, photo: Any, **kwargs) -> asyncio.Future:
+        return self.submit("send_photo", chat_id, photo, **kwargs)
+
+    def send_document(self, chat_id: int, document: Any, **kwargs) -> asyncio.Future:
+        return self.submit("send_document", chat_id, document, **kwargs)
+
+    def submit(self, method: str, chat_id: int, *args, **kwargs) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve_exception)
+        self._queue.put_nowait({
+            "method": method,
+            "chat_id": chat_id,
+            "args": args,
+            "kwargs": kwargs,
+            "future": future,
+            "attempt": 0,
+        })
+        return future
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        last_minute = sum(1 for t in self._sent_times if now - t < 60)
+        return {
+            "queued": self._queue.qsize(),
+            "workers": self.workers,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "sent_last_minute": last_minute,
+            "throughput_per_sec": round(last_minute / 60, 2),
+        }
+
+    # ===== Internals =====
+
+    def _reserve_slot(self, chat_id: int) -> float:
+        """Reserve the earliest slot allowed by both limits; returns seconds to wait"""
+        now = time.monotonic()
+        slot = max(now, self._global_next, self._chat_next.get(chat_id, 0.0))
+        self._global_next = slot + self.global_interval
+        self._chat_next[chat_id] = slot + self.per_chat_interval
+
+        # Keep per-chat table small
+        if len(self._chat_next) > 10000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        return slot - now
+
+    def _back_off(self, chat_id: int, retry_after: float):
+        until = time.monotonic() + retry_after
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), until)
+        # Flood control may be bot-wide - hold everyone back as well
+        self._global_next = max(self._global_next, until)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._send(job)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, job: dict):
+        future: asyncio.Future = job["future"]
+        chat_id = job["chat_id"]
+
+        while True:
+            delay = self._reserve_slot(chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                bot = globals.get_bot()
+                result = await getattr(bot, job["method"])(chat_id, *job["args"], **job["kwargs"])
+                self.sent += 1
+                self._sent_times.append(time.monotonic())
+                if not future.done():
+                    future.set_result(result)
+                return
+            except TelegramRetryAfter as e:
+                job["attempt"] += 1
+                if job["attempt"] > self.max_retries:
+                    self._fail(job, e)
+                    return
+                self.retried += 1
+                logger.warning(f"429 from Telegram for chat {chat_id}, retry in {e.retry_after}s")
+                self._back_off(chat_id, e.retry_after)
+            except Exception as e:
+                self._fail(job, e)
+                return
+
+    def _fail(self, job: dict, error: Exception):
+        self.failed += 1
+        logger.error(f"❌ Outbound {job['method']} to {job['chat_id']} failed: {error}")
+        future: Optional[asyncio.Future] = job["future"]
+        if future and not future.done():
+            future.set_exception(error)
@@ -0,0 +1,117 @@
+"""
+Background premium expiry.
+
+premium_until used to be checked only on read, so an expired master kept
+status active_premium and stayed on top of search results. Every interval
+the scheduler downgrades due masters in batches (Database.expire_premium:
+one UPDATE ... RETURNING that also writes status_logs) and queues a
+notification to each owner through the outbound sender.
+
+Every replica may run it: each batch takes a Postgres advisory lock, so only
+one replica downgrades at a time and the others skip the tick.
+"""
+
+import asyncio
+import html
+import logging
+import time
+from typing import Optional
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from utils.i18n import DEFAULT_LANGUAGE, get_text
+
+logger = logging.getLogger(__name__)
+
+
+class PremiumExpiryScheduler:
+    def __init__(self, db, outbound, interval: float = 300.0, batch_size: int = 500):
+        self.db = db
+        self.outbound = outbound
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.runs = 0
+        self.skipped = 0
+        self.expired = 0
+        self.notified = 0
+        self.failed = 0
+        self.last_run_at: Optional[float] = None
+
+    def start(self):
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"⏰ Premium expiry scheduler started: every {self.interval:g}s, batch {self.batch_size}")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def run_once(self) -> int:
+        """Downgrade all due masters; returns how many were downgraded by this replica"""
+        total = 0
+        while True:
+            masters = await self.db.expire_premium(self.batch_size)
+            if masters is None:
+                # Another replica is the leader for this tick
+                self.skipped += 1
+                break
+            total += len(masters)
+            for master in masters:
+                self._notify(master)
+            if len(masters) < self.batch_size:
+                break
+
+        self.runs += 1
+        self.expired += total
+        self.last_run_at = time.time()
+        if total:
+            logger.info(f"⏰ Premium expired for {total} masters")
+        return total
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "expired": self.expired,
+            "notified": self.notified,
+            "failed": self.failed,
+            "last_run_at": self.last_run_at,
+        }
+
+    # ===== Internals =====
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Premium expiry run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _notify(self, master: dict):
+        # Masters added by users (user_id -1) have no owner to tell
+        if not master.get('telegram_id'):
+            return
+        lang = master.get('language') or DEFAULT_LANGUAGE
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=get_text("menu_premium", lang), callback_data="menu_premium")]
+        ])
+        self.outbound.send_message(
+            master['telegram_id'],
+            get_text("premium_expired", lang, name=html.escape(master['name'] or '')),
+            reply_markup=keyboard,
+        )
+        self.notified += 1
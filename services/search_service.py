@@ -0,0 +1,217 @@
+"""
+In-process master search index.
+
+Keeps category -> masters and district -> masters posting sets plus each
+master's sort key, so a search is a set intersection + sort of the hits
+instead of EXISTS subqueries over master_categories/master_districts.
+Database write paths call refresh_masters() to keep it fresh.
+
+Free-text search (Database.search_masters_text) ranks its hits with the
+same sort key, see rank().
+"""
+
+import heapq
+import logging
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Same ordering as the CASE in Database.search_masters SQL
+STATUS_TIER = {
+    'active_premium': 0,
+    'active_free': 1,
+}
+
+# Free-text search: shorter terms produce no trigrams (full scan) and match everything
+MIN_TERM_LENGTH = 3
+MAX_TERMS = 5
+TEXT_SEARCH_LIMIT = 100
+
+# Nearby fallback: widen ring by ring until at least this many masters
+NEARBY_MIN_RESULTS = 5
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words without punctuation/emoji ("İ" and "ё" folded)"""
+    if not text:
+        return []
+    text = text.replace("İ", "i").lower().replace("ё", "е")
+    return _WORD_RE.findall(text)
+
+
+def cut_rings(rows: List[dict], min_results: int = NEARBY_MIN_RESULTS) -> List[dict]:
+    """
+    rows sorted by ring: keep whole rings until min_results is reached
+    (the ring that crosses the threshold is kept entirely)
+    """
+    for i, row in enumerate(rows):
+        if i >= min_results and row['ring'] != rows[i - 1]['ring']:
+            return rows[:i]
+    return rows
+
+
+class MasterSearchIndex:
+    def __init__(self):
+        # master_id -> { 'row': dict, 'categories': set, 'districts': set, 'sort_key': tuple }
+        self.masters: Dict[int, dict] = {}
+        # Posting sets
+        self.by_category: Dict[int, Set[int]] = {}
+        self.by_district: Dict[int, Set[int]] = {}
+        self.loaded = False
+
+    async def load(self, db):
+        """Build the whole index from DB"""
+        started = time.perf_counter()
+        rows = await db.get_master_index_rows()
+
+        self.masters = {}
+        self.by_category = {}
+        self.by_district = {}
+        for row in rows:
+            self._add(row)
+
+        self.loaded = True
+        logger.info(f"Search index loaded: {len(self.masters)} masters in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    async def refresh_masters(self, db, master_ids: List[int]):
+        """Re-read masters from DB in one query and replace their postings"""
+        rows = await db.get_master_index_rows(master_ids)
+        for master_id in master_ids:
+            self.remove_master(master_id)
+        for row in rows:
+            self._add(row)
+
+    def remove_master(self, master_id: int):
+        entry = self.masters.pop(master_id, None)
+        if not entry:
+            return
+        for cat_id in entry['categories']:
+            self._discard(self.by_category, cat_id, master_id)
+        for dist_id in entry['districts']:
+            self._discard(self.by_district, dist_id, master_id)
+
+    def search(self, category_ids: List[int], district_ids: List[int], exclude_user_id: int = None) -> List[dict]:
+        """Same contract as Database.search_masters (rows are copies)"""
+        if not category_ids or not district_ids:
+            return []
+
+        by_cat = set().union(*(self.by_category.get(c, ()) for c in category_ids))
+        if not by_cat:
+            return []
+        by_dist = set().union(*(self.by_district.get(d, ()) for d in district_ids))
+        hits = by_cat & by_dist
+
+        entries = []
+        for master_id in hits:
+            entry = self.masters[master_id]
+            row = entry['row']
+            if row['status'] == 'blocked':
+                continue
+            if exclude_user_id is not None and row['user_id'] == exclude_user_id:
+                continue
+            entries.append(entry)
+
+        entries.sort(key=lambda e: e['sort_key'])
+        return [dict(e['row']) for e in entries]
+
+    def search_nearby(self, category_ids: List[int], district_rings: Dict[int, int], exclude_user_id: int = None, min_results: int = NEARBY_MIN_RESULTS) -> List[dict]:
+        """
+        Masters of category_ids in any district of district_rings, each tagged with
+        its nearest 'ring', ordered by ring then the usual sort key - one pass over the hits.
+        """
+        if not category_ids or not district_rings:
+            return []
+
+        by_cat = set().union(*(self.by_category.get(c, ()) for c in category_ids))
+        if not by_cat:
+            return []
+        by_dist = set().union(*(self.by_district.get(d, ()) for d in district_rings))
+
+        ranked = []
+        for master_id in by_cat & by_dist:
+            entry = self.masters[master_id]
+            row = entry['row']
+            if row['status'] == 'blocked':
+                continue
+            if exclude_user_id is not None and row['user_id'] == exclude_user_id:
+                continue
+            ring = min(district_rings[d] for d in entry['districts'] if d in district_rings)
+            ranked.append((ring, entry['sort_key'], row))
+
+        ranked.sort(key=lambda r: (r[0], r[1]))
+        return cut_rings([{**row, 'ring': ring} for ring, _, row in ranked], min_results)
+
+    def rank(self, master_ids: Iterable[int], category_ids: Iterable[int] = (), exclude_user_id: int = None, limit: int = TEXT_SEARCH_LIMIT) -> List[dict]:
+        """Masters from master_ids plus everyone in category_ids, in search order"""
+        hits = set(master_ids)
+        for cat_id in category_ids:
+            hits |= self.by_category.get(cat_id, set())
+
+        entries = []
+        for master_id in hits:
+            entry = self.masters.get(master_id)
+            if entry is None:
+                continue
+            row = entry['row']
+            if row['status'] == 'blocked':
+                continue
+            if exclude_user_id is not None and row['user_id'] == exclude_user_id:
+                continue
+            entries.append(entry)
+
+        # A broad term ("ремонт") can hit thousands of masters - only the shown ones get sorted
+        top = heapq.nsmallest(limit, entries, key=lambda e: e['sort_key'])
+        return [dict(e['row']) for e in top]
+
+    def stats(self) -> dict:
+        return {
+            'masters': len(self.masters),
+            'categories': len(self.by_category),
+            'districts': len(self.by_district),
+            'loaded': self.loaded,
+        }
+
+    # ===== Internals =====
+
+    def _add(self, row):
+        row = dict(row)
+        master_id = row['id']
+        categories = set(row.pop('category_ids', None) or [])
+        districts = set(row.pop('district_ids', None) or [])
+        if row.get('completed_count') is None:
+            row['completed_count'] = 0
+
+        self.masters[master_id] = {
+            'row': row,
+            'categories': categories,
+            'districts': districts,
+            'sort_key': self._sort_key(row),
+        }
+        for cat_id in categories:
+            self.by_category.setdefault(cat_id, set()).add(master_id)
+        for dist_id in districts:
+            self.by_district.setdefault(dist_id, set()).add(master_id)
+
+    @staticmethod
+    def _sort_key(row: dict) -> tuple:
+        # status tier ASC, rating DESC, completed DESC, id for a stable order.
+        # NULL rating/completed sort as 0 - the SQL paths ORDER BY the same COALESCEs
+        return (
+            STATUS_TIER.get(row['status'], 2),
+            -(row.get('rating') or 0.0),
+            -(row.get('completed_count') or 0),
+            row['id'],
+        )
+
+    @staticmethod
+    def _discard(postings: Dict[int, Set[int]], key: int, master_id: int):
+        ids = postings.get(key)
+        if ids is None:
+            return
+        ids.discard(master_id)
+        if not ids:
+            del postings[key]
@@ -0,0 +1,68 @@
+"""
+Startup helpers shared by webhook (lifespan) and polling modes.
+
+- Reference data (categories, districts, district adjacency) is fetched once and fed to both
+  config.* and CacheService.
+- StartupTimer records per-phase durations; phases may overlap when run
+  concurrently, so "total" is wall time, not the sum.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.total_ms = None
+
+    @asynccontextmanager
+    async def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - started) * 1000
+
+    def report(self) -> dict:
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        phases = " | ".join(f"{name} {ms:.0f}ms" for name, ms in self.phases.items())
+        logger.info(f"⏱️ Startup: {phases} | total {self.total_ms:.0f}ms")
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases.items()},
+            "total_ms": round(self.total_ms, 1) if self.total_ms is not None else None,
+        }
+
+
+async def load_reference_data(db) -> Tuple[List[dict], List[dict], List[dict]]:
+    """Fetch all categories, districts and district adjacency in one pass (queries run concurrently)"""
+    return await asyncio.gather(db.get_all_categories(), db.get_districts(), db.get_district_adjacency())
+
+
+def sync_config(categories: List[dict], districts: List[dict]):
+    """Synchronize config.py variables with current database state"""
+    if districts:
+        config.DISTRICTS[:] = [d['key_field'] for d in districts]
+
+    # All categories for general key access
+    if categories:
+        config.CATEGORIES[:] = [c['key_field'] for c in categories]
+
+        # CATEGORY_GROUPS is now legacy but we can populate it with root parents for safety
+        config.CATEGORY_GROUPS.clear()
+        for c in categories:
+            if c['parent_id'] is None:
+                config.CATEGORY_GROUPS[c['key_field']] = []  # Empty list as we use dynamic navigation
+
+    logger.info(f"⚙️ Config synced with DB: {len(config.CATEGORIES)} categories, {len(config.DISTRICTS)} districts")
@@ -0,0 +1,131 @@
+"""
+Asynchronous webhook ingestion.
+
+The webhook acknowledges an update right away and submits it here; a pool of
+workers drains it. Updates of the same chat are processed strictly in order,
+different chats run in parallel (no head-of-line blocking between chats).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+def get_chat_key(update: Update) -> Hashable:
+    """Ordering key for an update: chat id if known, otherwise the update itself"""
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query:
+        cq = update.callback_query
+        if cq.message:
+            return cq.message.chat.id
+        return cq.from_user.id
+    if update.my_chat_member:
+        return update.my_chat_member.chat.id
+    return ("update", update.update_id)
+
+
+class UpdateQueue:
+    def __init__(self, handler: Callable[[Update], Awaitable], workers: int = 8, max_size: int = 1000):
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+
+        # chat key -> updates waiting for that chat (key present while the chat is queued or running)
+        self._pending: Dict[Hashable, Deque[Update]] = {}
+        # chat keys ready to be picked up by a worker
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tasks = []
+        self._size = 0
+
+        # Stats
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.busy_workers = 0
+        self._busy_seconds = 0.0
+        self._started_at: Optional[float] = None
+
+    def start(self):
+        if self._tasks:
+            return
+        self._started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"📥 Update queue started: {self.workers} workers, max {self.max_size} queued")
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain queued updates (up to timeout), then stop workers"""
+        deadline = time.monotonic() + timeout
+        while (self._size or self.busy_workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._size:
+            logger.warning(f"Update queue stopped with {self._size} unprocessed updates")
+
+    def submit(self, update: Update) -> bool:
+        """Queue an update; False if the queue is full (caller should reject it)"""
+        self.received += 1
+        if self._size >= self.max_size:
+            self.dropped += 1
+            return False
+
+        key = get_chat_key(update)
+        chat_queue = self._pending.get(key)
+        if chat_queue is None:
+            self._pending[key] = deque([update])
+            self._ready.put_nowait(key)
+        else:
+            # Chat already queued/running - its worker will pick this up in order
+            chat_queue.append(update)
+        self._size += 1
+        return True
+
+    def stats(self) -> dict:
+        busy_seconds = self._busy_seconds
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        capacity = uptime * self.workers
+        return {
+            "depth": self._size,
+            "chats_pending": len(self._pending),
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "busy_workers": self.busy_workers,
+            "utilization": round(busy_seconds / capacity, 4) if capacity else 0.0,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _worker(self, worker_id: int):
+        while True:
+            key = await self._ready.get()
+            self.busy_workers += 1
+            started = time.monotonic()
+            try:
+                chat_queue = self._pending[key]
+                while chat_queue:
+                    update = chat_queue.popleft()
+                    self._size -= 1
+                    try:
+                        await self.handler(update)
+                        self.processed += 1
+                    except Exception:
+                        self.failed += 1
+                        logger.exception(f"❌ Worker {worker_id} failed on update {update.update_id}")
+                # No await between the empty check and removal - new updates for this
+                # chat either landed in chat_queue above or will re-register the key
+                del self._pending[key]
+            finally:
+                self.busy_workers -= 1
+                self._busy_seconds += time.monotonic() - started
@@ -1,37 +1,299 @@
 import time
 from collections import OrderedDict
-from config import USER_CACHE_TTL, USER_CACHE_MAX_SIZE
+from config import (
+    USER_CACHE_TTL, USER_CACHE_MAX_SIZE, PENDING_ORDER_CACHE_TTL,
+    SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_SIZE, MASTER_CARD_CACHE_TTL, MASTER_CARD_CACHE_MAX_SIZE,
+)
+from utils.memory_utils import estimate_size
 
 class UserCache:
     def __init__(self):
         self.cache = OrderedDict()
+        # Secondary index: user_id -> telegram_id (kept in sync with self.cache)
+        self.by_user_id = {}
         self.ttl = USER_CACHE_TTL
         self.max_size = USER_CACHE_MAX_SIZE
+        self.hits = 0
+        self.misses = 0
+        # Approximate bytes held by entries, maintained on insert/evict (see /dev)
+        self.bytes = 0
 
     def get(self, telegram_id: int):
         if telegram_id in self.cache:
-            data, timestamp = self.cache[telegram_id]
+            data, timestamp, _ = self.cache[telegram_id]
             if time.time() - timestamp < self.ttl:
                 # Move to end (MRU)
                 self.cache.move_to_end(telegram_id)
+                self.hits += 1
                 return data
             else:
                 # Expired
-                del self.cache[telegram_id]
+                self._remove(telegram_id)
+        self.misses += 1
         return None
 
+    def get_by_user_id(self, user_id: int):
+        """O(1) lookup by internal users.id via the secondary index"""
+        telegram_id = self.by_user_id.get(user_id)
+        if telegram_id is None:
+            self.misses += 1
+            return None
+        return self.get(telegram_id)
+
     def set(self, telegram_id: int, data: dict):
         if telegram_id in self.cache:
+            # Drop stale index entry in case user_id changed for this telegram_id
+            old_data, _, old_size = self.cache[telegram_id]
+            self._unindex(telegram_id, old_data)
+            self.bytes -= old_size
             self.cache.move_to_end(telegram_id)
-        self.cache[telegram_id] = (data, time.time())
-        
+        size = estimate_size(data)
+        self.cache[telegram_id] = (data, time.time(), size)
+        self.bytes += size
+
+        user_id = data.get('user_id')
+        if user_id is not None:
+            self.by_user_id[user_id] = telegram_id
+
         # Enforce max size
         if len(self.cache) > self.max_size:
-            self.cache.popitem(last=False) # Remove FIFO (oldest inserted/accessed)
+            # Remove FIFO (oldest inserted/accessed)
+            old_tg_id, (old_data, _, old_size) = self.cache.popitem(last=False)
+            self._unindex(old_tg_id, old_data)
+            self.bytes -= old_size
 
     def invalidate(self, telegram_id: int):
         if telegram_id in self.cache:
-            del self.cache[telegram_id]
-            
+            self._remove(telegram_id)
+
+    def invalidate_user(self, user_id: int):
+        """Invalidate entry by internal users.id"""
+        telegram_id = self.by_user_id.get(user_id)
+        if telegram_id is not None:
+            self.invalidate(telegram_id)
+
+    def clear(self):
+        self.cache.clear()
+        self.by_user_id.clear()
+        self.bytes = 0
+
+    def _remove(self, telegram_id: int):
+        data, _, size = self.cache.pop(telegram_id)
+        self._unindex(telegram_id, data)
+        self.bytes -= size
+
+    def _unindex(self, telegram_id: int, data: dict):
+        user_id = data.get('user_id')
+        if user_id is not None and self.by_user_id.get(user_id) == telegram_id:
+            del self.by_user_id[user_id]
+
+
+class PendingOrderCache:
+    """
+    Per-client verdict for OrderCheckMiddleware:
+    client_id -> (pending_order or None, recheck_at, size)
+
+    A client without an overdue order can't become blocked before its oldest
+    active order turns 24h old, so the verdict is valid until then.
+    Invalidated by Database.create_order / complete_order.
+    """
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        self.max_ttl = PENDING_ORDER_CACHE_TTL
+        self.max_size = USER_CACHE_MAX_SIZE
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def get(self, client_id: int):
+        """Returns (hit, pending_order)"""
+        if client_id in self.cache:
+            pending_order, recheck_at, _ = self.cache[client_id]
+            if time.monotonic() < recheck_at:
+                self.cache.move_to_end(client_id)
+                self.hits += 1
+                return True, pending_order
+            self.invalidate(client_id)
+        self.misses += 1
+        return False, None
+
+    def set(self, client_id: int, pending_order: dict = None, valid_for: float = None):
+        if valid_for is None or valid_for > self.max_ttl:
+            valid_for = self.max_ttl
+        if client_id in self.cache:
+            self.bytes -= self.cache[client_id][2]
+            self.cache.move_to_end(client_id)
+        size = estimate_size(pending_order)
+        self.cache[client_id] = (pending_order, time.monotonic() + valid_for, size)
+        self.bytes += size
+
+        if len(self.cache) > self.max_size:
+            _, (_, _, old_size) = self.cache.popitem(last=False)
+            self.bytes -= old_size
+
+    def invalidate(self, client_id: int):
+        entry = self.cache.pop(client_id, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        self.cache.clear()
+        self.bytes = 0
+
+
+class SearchResultCache:
+    """
+    Master search results shared by all users:
+    key -> (rows, expires_at, category_ids, district_ids, size)
+
+    key is a normalized query tuple, e.g. ("districts", (cat ids...), (district ids...)).
+    category_ids / district_ids (frozensets, None = any) drive targeted invalidation:
+    a master write drops only the entries whose categories and districts it touches.
+    Rows are shared between readers and must not be mutated.
+    A generation bumped on every invalidation guards against caching rows read
+    before a write (same idea as MasterCardCache).
+    """
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        # Bumped by invalidate_master / clear
+        self._generation = 0
+        self.ttl = SEARCH_CACHE_TTL
+        self.max_size = SEARCH_CACHE_MAX_SIZE
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def get(self, key: tuple):
+        entry = self.cache.get(key)
+        if entry is not None:
+            if time.monotonic() < entry[1]:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.invalidate(key)
+        self.misses += 1
+        return None
+
+    def generation(self) -> int:
+        """Read before running the query; pass to set()"""
+        return self._generation
+
+    def set(self, key: tuple, rows: list, category_ids=None, district_ids=None, generation: int = None):
+        if generation is not None and generation != self._generation:
+            return  # a master changed while the query was in flight
+        if key in self.cache:
+            self.bytes -= self.cache[key][4]
+            self.cache.move_to_end(key)
+        # List + row dicts; the rows themselves are shared with nobody else
+        size = estimate_size(rows) + sum(estimate_size(row) for row in rows)
+        self.cache[key] = (
+            rows,
+            time.monotonic() + self.ttl,
+            frozenset(category_ids) if category_ids is not None else None,
+            frozenset(district_ids) if district_ids is not None else None,
+            size,
+        )
+        self.bytes += size
+
+        if len(self.cache) > self.max_size:
+            _, old_entry = self.cache.popitem(last=False)
+            self.bytes -= old_entry[4]
+
+    def invalidate(self, key: tuple):
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[4]
+
+    def invalidate_master(self, category_ids, district_ids):
+        """Drop entries a master with these categories/districts could appear in"""
+        self._generation += 1
+        category_ids = set(category_ids)
+        district_ids = set(district_ids)
+        stale = [
+            key for key, (_, _, cats, dists, _) in self.cache.items()
+            if (cats is None or not cats.isdisjoint(category_ids))
+            and (dists is None or not dists.isdisjoint(district_ids))
+        ]
+        for key in stale:
+            self.invalidate(key)
+
+    def clear(self):
+        self._generation += 1
+        self.cache.clear()
+        self.bytes = 0
+
+
+class MasterCardCache:
+    """
+    Rendered master screens: (master_id, view) -> (card, expires_at, size)
+    view is e.g. ("card", lang) for the profile card or ("reviews", lang, cursor...)
+    for a review page; card is whatever the handler renders (text, keyboard).
+
+    Invalidated by Database._refresh_search_index on every master write
+    (profile, status, rating, order counters, new reviews). A per-master generation
+    guards against caching a card rendered from data read before a write.
+    """
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        # master_id -> views cached, for invalidate_master
+        self.views = {}
+        # master_id -> bumped on every invalidation
+        self.generations = {}
+        self.ttl = MASTER_CARD_CACHE_TTL
+        self.max_size = MASTER_CARD_CACHE_MAX_SIZE
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def generation(self, master_id: int) -> int:
+        """Read before fetching the master; pass to set()"""
+        return self.generations.get(master_id, 0)
+
+    def get(self, master_id: int, view: tuple):
+        key = (master_id, view)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if time.monotonic() < entry[1]:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def set(self, master_id: int, view: tuple, card: tuple, generation: int):
+        if generation != self.generation(master_id):
+            return  # the master changed while the card was being rendered
+        key = (master_id, view)
+        if key in self.cache:
+            self._remove(key)
+        size = estimate_size(card)
+        self.cache[key] = (card, time.monotonic() + self.ttl, size)
+        self.views.setdefault(master_id, set()).add(view)
+        self.bytes += size
+
+        if len(self.cache) > self.max_size:
+            self._remove(next(iter(self.cache)))
+
+    def invalidate_master(self, master_id: int):
+        self.generations[master_id] = self.generation(master_id) + 1
+        for view in list(self.views.get(master_id, ())):
+            self._remove((master_id, view))
+
     def clear(self):
         self.cache.clear()
+        self.views.clear()
+        self.bytes = 0
+
+    def _remove(self, key: tuple):
+        _, _, size = self.cache.pop(key)
+        self.bytes -= size
+        master_id, view = key
+        views = self.views.get(master_id)
+        if views is not None:
+            views.discard(view)
+            if not views:
+                del self.views[master_id]
@@ -2,6 +2,8 @@
 # utils/i18n.py — Multilingual Support
 # ================================
 
+from string import Formatter
+
 from config import DEFAULT_LANGUAGE, SUPPORTED_LANGUAGES, MODERATOR_USERNAME
 
 MESSAGES = {
@@ -62,7 +64,8 @@ MESSAGES = {
         "field_orders_count": "заказов",
 
         # Find master flow
-        "find_master_start": "Сейчас подберём мастера. Что нужно?",
+        "find_master_start": "Сейчас подберём мастера. Что нужно?\n\n🔎 Выберите услугу или напишите, что ищете (например, «кондиционер»).",
+        "text_search_no_results": "😞 По запросу «{query}» ничего не нашлось. Попробуйте другое слово или выберите услугу из списка.",
         "select_group": "Что нужно?",
         "select_service": "Какая услуга нужна?",
         "select_districts": "Где нужен мастер? Можно выбрать несколько районов.",
@@ -284,6 +287,7 @@ MESSAGES = {
         "master_reviews_header": "Отзывы",
         "reviews_no": "Нет отзывов",
         "search_results_header": "🔍 Результаты поиска ({count}):", 
+        "search_results_nearby_header": "📍 В выбранных районах мастеров нет. Мастера из соседних районов ({count}):",
 
         # Premium Status
         "premium_title": "💎 <b>Премиум-статус</b>",
@@ -296,6 +300,7 @@ MESSAGES = {
         "btn_buy_premium": "💳 Купить премиум",
         "btn_i_paid": "✅ Я оплатил",
         "admin_premium_payment": "💎 <b>Новая заявка на Премиум!</b>\n\nМастер: {name}\nID пользователя: <code>{user_id}</code>\nТелефон: {phone}",
+        "premium_expired": "⌛️ Срок премиум-статуса анкеты <b>{name}</b> истёк. Анкета переведена в обычный статус.\nПродлите премиум, чтобы снова быть выше в списке.",
         
         # ===== Categories =====
         "category_home_living": "🏠 Дом и быт",
@@ -834,7 +839,8 @@ MESSAGES = {
         "field_orders_count": "sipariş",
 
         # Find master flow
-        "find_master_start": "Usta bulalım. Ne gerekiyor?",
+        "find_master_start": "Usta bulalım. Ne gerekiyor?\n\n🔎 Hizmeti seçin veya ne aradığınızı yazın (ör. «klima»).",
+        "text_search_no_results": "😞 «{query}» için sonuç bulunamadı. Başka bir kelime deneyin veya listeden hizmet seçin.",
         "select_group": "Ne gerekiyor?",
         "select_service": "Hangi hizmet gerekiyor?",
         "select_districts": "Nerede usta lazım? Birden fazla seçebilirsiniz.",
@@ -1055,6 +1061,7 @@ MESSAGES = {
         "master_reviews_header": "İncelemeler",
         "reviews_no": "Hiç yorum bulunamadı.",
         "search_results_header": "🔍 Arama sonuçları ({count}):", 
+        "search_results_nearby_header": "📍 Seçilen bölgelerde usta yok. Yakın bölgelerdeki ustalar ({count}):",
 
         # Premium Status
         "premium_title": "💎 <b>Premium Statü</b>",
@@ -1067,6 +1074,7 @@ MESSAGES = {
         "btn_buy_premium": "💳 Premium Satın Al",
         "btn_i_paid": "✅ Ödedim",
         "admin_premium_payment": "💎 <b>Yeni Premium Talebi!</b>\n\nUsta: {name}\nKullanıcı ID: <code>{user_id}</code>\nTelefon: {phone}",
+        "premium_expired": "⌛️ <b>{name}</b> profilinin Premium süresi doldu. Profil standart duruma alındı.\nListede tekrar üst sıralarda görünmek için Premium’u yenileyin.",
         
         # ===== Categories =====
         "category_home_living": "🏠 Ev & Yaşam",
@@ -1605,7 +1613,8 @@ MESSAGES = {
         "field_orders_count": "orders",
 
         # Find master flow
-        "find_master_start": "Let's find a master. What do you need?",
+        "find_master_start": "Let's find a master. What do you need?\n\n🔎 Pick a service or type what you need (e.g. «plumbing»).",
+        "text_search_no_results": "😞 Nothing found for «{query}». Try another word or pick a service from the list.",
         "select_group": "What do you need?",
         "select_service": "Which service do you need?",
         "select_districts": "Where do you need the master? You can select multiple districts.",
@@ -1812,6 +1821,7 @@ MESSAGES = {
         "master_reviews_header": "Reviews",
         "reviews_no": "No reviews",
         "search_results_header": "🔍 Search Results ({count}):", 
+        "search_results_nearby_header": "📍 No masters in the selected districts. Masters from nearby districts ({count}):",
 
         # Premium Status
         "premium_title": "💎 <b>Premium Status</b>",
@@ -1824,6 +1834,7 @@ MESSAGES = {
         "btn_buy_premium": "💳 Buy Premium",
         "btn_i_paid": "✅ I Paid",
         "admin_premium_payment": "💎 <b>New Premium Request!</b>\n\nMaster: {name}\nUser ID: <code>{user_id}</code>\nPhone: {phone}",
+        "premium_expired": "⌛️ Premium status of the profile <b>{name}</b> has expired. The profile is now on the standard plan.\nRenew Premium to be shown higher in the list again.",
         
         # ===== Categories =====
         "category_home_living": "🏠 Home & Living",
@@ -2309,26 +2320,76 @@ MESSAGES = {
     }
 }
 
+# ====== Compiled catalog ======
+# Built once at import from MESSAGES:
+#   _CATALOG[lang][key] -> (raw_text, compiled)
+#   compiled = (percent_template, field_names) - the str.format template pre-split
+#   into a "%s" template, or None for templates only str.format can handle
+#   (positional/attribute fields, conversions, format specs)
+# and direct name maps for get_category_name / get_district_name.
+_formatter = Formatter()
+
+def _compile_template(text: str):
+    try:
+        parsed = list(_formatter.parse(text))
+    except ValueError:
+        return None
+    chunks = []
+    fields = []
+    for literal, field, spec, conversion in parsed:
+        chunks.append(literal.replace("%", "%%"))
+        if field is not None:
+            if conversion or spec or not field.isidentifier():
+                return None
+            chunks.append("%s")
+            fields.append(field)
+    return "".join(chunks), tuple(fields)
+
+def _render(text: str, compiled, kwargs: dict) -> str:
+    if compiled is None:
+        return text.format(**kwargs)
+    template, fields = compiled
+    # Missing field raises KeyError, same as str.format
+    return template % tuple([kwargs[field] for field in fields])
+
+def _compile_names(prefix: str) -> dict:
+    size = len(prefix)
+    return {
+        lang: {key[size:]: text for key, text in MESSAGES.get(lang, {}).items() if key.startswith(prefix)}
+        for lang in SUPPORTED_LANGUAGES
+    }
+
+_CATALOG = {
+    lang: {key: (text, _compile_template(text)) for key, text in MESSAGES.get(lang, {}).items()}
+    for lang in SUPPORTED_LANGUAGES
+}
+_DEFAULT_CATALOG = _CATALOG.get(DEFAULT_LANGUAGE, {})
+_CATEGORY_NAMES = _compile_names("category_")
+_DISTRICT_NAMES = _compile_names("district_")
+
+
 def get_text(key: str, language: str = DEFAULT_LANGUAGE, **kwargs) -> str:
     """Get translated message"""
-    if language not in SUPPORTED_LANGUAGES:
-        language = DEFAULT_LANGUAGE
-    
-    text = MESSAGES.get(language, {}).get(key, f"[{key}]")
-    
+    entry = _CATALOG.get(language, _DEFAULT_CATALOG).get(key)
+    if entry is None:
+        return f"[{key}]"
+
+    text, compiled = entry
+    if not kwargs:
+        return text
+
     # Format with kwargs
-    if kwargs:
-        try:
-            text = text.format(**kwargs)
-        except KeyError as e:
-            text = f"{text}\n[Missing key: {e}]"
-    
-    return text
+    try:
+        return _render(text, compiled, kwargs)
+    except KeyError as e:
+        return f"{text}\n[Missing key: {e}]"
 
 def get_category_name(category_key: str, language: str = DEFAULT_LANGUAGE) -> str:
     """Get translated category name by key"""
-    return get_text(f"category_{category_key}", language)
+    name = _CATEGORY_NAMES.get(language, _CATEGORY_NAMES.get(DEFAULT_LANGUAGE, {})).get(category_key)
+    return name if name is not None else f"[category_{category_key}]"
 
 def get_district_name(district_key: str, language: str = DEFAULT_LANGUAGE) -> str:
     """Get translated district name by key"""
-    return get_text(f"district_{district_key}", language)
+    name = _DISTRICT_NAMES.get(language, _DISTRICT_NAMES.get(DEFAULT_LANGUAGE, {})).get(district_key)
+    return name if name is not None else f"[district_{district_key}]"
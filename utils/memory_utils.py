@@ -1,9 +1,10 @@
 import sys
-import psutil
 import os
+import tracemalloc
+from typing import Optional
 
 def get_size(obj, seen=None):
-    """Recursively finds size of objects in bytes"""
+    """Recursively finds size of objects in bytes (slow - startup/offline use only)"""
     size = sys.getsizeof(obj)
     if seen is None:
         seen = set()
@@ -25,7 +26,97 @@ def get_size(obj, seen=None):
             pass
     return size
 
+def estimate_size(obj) -> int:
+    """
+    Approximate bytes of a cache entry: the object plus its direct items.
+    One level only, so it's cheap enough to call on every cache insert.
+    """
+    if obj is None:
+        return 0
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += sys.getsizeof(item)
+    return size
+
 def get_process_memory():
     """Returns RSS memory of the current process in KB"""
+    import psutil  # keep utils.cache importable without psutil
     process = psutil.Process(os.getpid())
     return process.memory_info().rss / 1024
+
+
+# ====== tracemalloc (leak hunting via /dev/tracemalloc/*) ======
+# Baseline snapshot for diffs; taking/comparing snapshots is CPU-heavy,
+# callers run these in a worker thread
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+def tracemalloc_start(frames: int = 1) -> dict:
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _baseline = None
+    return tracemalloc_status()
+
+def tracemalloc_stop() -> dict:
+    global _baseline
+    tracemalloc.stop()
+    _baseline = None
+    return tracemalloc_status()
+
+def tracemalloc_status() -> dict:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "has_baseline": _baseline is not None,
+    }
+
+def _filtered_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+def tracemalloc_snapshot(limit: int = 20, key_type: str = "lineno") -> dict:
+    """Store a new baseline and return the top allocations"""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return {"error": "tracemalloc is not started"}
+    _baseline = _filtered_snapshot()
+    top = _baseline.statistics(key_type)[:limit]
+    return {
+        **tracemalloc_status(),
+        "top": [
+            {"where": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in top
+        ],
+    }
+
+def tracemalloc_diff(limit: int = 20, key_type: str = "lineno") -> dict:
+    """Top growth since the baseline snapshot, by file ("filename") or line ("lineno")"""
+    if not tracemalloc.is_tracing():
+        return {"error": "tracemalloc is not started"}
+    if _baseline is None:
+        return {"error": "no baseline - call snapshot first"}
+    current = _filtered_snapshot()
+    diff = current.compare_to(_baseline, key_type)[:limit]
+    return {
+        **tracemalloc_status(),
+        "top": [
+            {
+                "where": str(stat.traceback),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "size_kb": round(stat.size / 1024, 1),
+                "count_diff": stat.count_diff,
+            }
+            for stat in diff
+        ],
+    }
@@ -0,0 +1,257 @@
+"""
+File-driven migration runner.
+
+- Discovers migrations/init_pg.sql (version 0) and migrations/NNN_*.sql
+- Serializes replicas with a Postgres advisory lock (polled, see MigrationRunner._acquire_lock)
+- Applies each file in its own transaction and records its checksum
+- Files with CREATE/DROP/REINDEX ... CONCURRENTLY run outside a transaction,
+  statement by statement, so index builds on large tables don't block writes
+- Stops at the first failure (later files may depend on it)
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import List
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+INITIAL_SCHEMA_FILE = "init_pg.sql"
+
+# pg_advisory_lock key shared by all replicas ("mersinmg")
+ADVISORY_LOCK_KEY = 0x6D657273696E6D67
+# Seconds between pg_try_advisory_lock attempts while another replica migrates
+LOCK_POLL_INTERVAL = 1.0
+
+_FILE_RE = re.compile(r"^(\d{3})_([\w-]+)\.sql$")
+_CONCURRENTLY_RE = re.compile(r"\b(?:INDEX|REINDEX\s+\w+)\s+CONCURRENTLY\b", re.IGNORECASE)
+_CONCURRENT_INDEX_NAME_RE = re.compile(
+    r"\bCREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+
+
+class MigrationError(Exception):
+    pass
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    path: str
+    sql: str
+    checksum: str
+
+    @property
+    def transactional(self) -> bool:
+        return not _CONCURRENTLY_RE.search(_strip_comments(self.sql))
+
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """All migration files ordered by version"""
+    found = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename == INITIAL_SCHEMA_FILE:
+            version, name = 0, "init_pg"
+        else:
+            match = _FILE_RE.match(filename)
+            if not match:
+                continue
+            version, name = int(match.group(1)), match.group(2)
+
+        if version in found:
+            raise MigrationError(f"Duplicate migration version {version}: {found[version].path}, {filename}")
+
+        path = os.path.join(directory, filename)
+        with open(path, "rb") as f:
+            raw = f.read()
+        found[version] = Migration(
+            version=version,
+            name=name,
+            path=path,
+            sql=raw.decode("utf-8"),
+            checksum=hashlib.sha256(raw).hexdigest(),
+        )
+    return [found[v] for v in sorted(found)]
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split a script on top-level semicolons (respects quotes, dollar quotes and comments)"""
+    statements = []
+    current = []
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = n if end == -1 else end
+            current.append(sql[i:end])
+            i = end
+            continue
+        if sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            current.append(sql[i:end])
+            i = end
+            continue
+        if ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if sql[end] == ch:
+                    if end + 1 < n and sql[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        if ch == "$":
+            match = re.match(r"\$[A-Za-z_]*\$", sql[i:])
+            if match:
+                tag = match.group(0)
+                end = sql.find(tag, i + len(tag))
+                end = n if end == -1 else end + len(tag)
+                current.append(sql[i:end])
+                i = end
+                continue
+        if ch == ";":
+            statements.append("".join(current))
+            current = []
+            i += 1
+            continue
+        current.append(ch)
+        i += 1
+    statements.append("".join(current))
+    return [s.strip() for s in statements if _strip_comments(s).strip()]
+
+
+def _strip_comments(sql: str) -> str:
+    sql = re.sub(r"/\*.*?\*/", " ", sql, flags=re.DOTALL)
+    return re.sub(r"--[^\n]*", " ", sql)
+
+
+class MigrationRunner:
+    def __init__(self, pool, directory: str = MIGRATIONS_DIR, lock_timeout: str = "10s", wait_timeout: float = 600.0):
+        self.pool = pool
+        self.directory = directory
+        # Max wait for a table lock; DDL queued behind a long query would block all traffic on that table
+        self.lock_timeout = lock_timeout
+        # Max wait for the advisory lock while another replica applies migrations
+        self.wait_timeout = wait_timeout
+
+    async def run(self) -> List[int]:
+        """Apply pending migrations; returns applied versions"""
+        migrations = discover_migrations(self.directory)
+        applied_now = []
+
+        async with self.pool.acquire() as conn:
+            await self._acquire_lock(conn)
+            try:
+                await self._ensure_table(conn)
+                applied = {
+                    row['version']: row['checksum']
+                    for row in await conn.fetch("SELECT version, checksum FROM schema_migrations")
+                }
+
+                for migration in migrations:
+                    if migration.version in applied:
+                        await self._verify_checksum(conn, migration, applied[migration.version])
+                        continue
+                    await self._apply(conn, migration)
+                    applied_now.append(migration.version)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", ADVISORY_LOCK_KEY)
+
+        if applied_now:
+            log.info(f"✅ Migrations applied: {applied_now}")
+        return applied_now
+
+    async def _acquire_lock(self, conn):
+        """
+        Poll pg_try_advisory_lock instead of blocking in pg_advisory_lock: a backend
+        waiting inside a statement keeps its snapshot open, and the holder's
+        CREATE INDEX CONCURRENTLY waits for every older snapshot - a deadlock.
+        Between attempts the waiting connection is idle and holds no snapshot.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        waiting = False
+        while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", ADVISORY_LOCK_KEY):
+            if time.monotonic() >= deadline:
+                raise MigrationError(f"Timed out after {self.wait_timeout:g}s waiting for the migration lock")
+            if not waiting:
+                log.info("Waiting for another replica to finish migrations...")
+                waiting = True
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    async def _ensure_table(self, conn):
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version     INTEGER PRIMARY KEY,
+                applied_at  TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        await conn.execute("ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS name TEXT")
+        await conn.execute("ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS checksum TEXT")
+
+    async def _verify_checksum(self, conn, migration: Migration, checksum: str):
+        if checksum is None:
+            # Applied by the old hard-coded runner - adopt the current file
+            await conn.execute(
+                "UPDATE schema_migrations SET name=$2, checksum=$3 WHERE version=$1",
+                migration.version, migration.name, migration.checksum
+            )
+        elif checksum != migration.checksum:
+            log.warning(f"⚠️ Migration {migration.version} ({migration.name}) changed after it was applied")
+
+    async def _apply(self, conn, migration: Migration):
+        filename = os.path.basename(migration.path)
+        mode = "transaction" if migration.transactional else "no transaction"
+        log.info(f"Applying {filename} ({mode})...")
+        try:
+            if migration.transactional:
+                async with conn.transaction():
+                    await conn.execute(f"SET LOCAL lock_timeout = '{self.lock_timeout}'")
+                    await conn.execute(migration.sql)
+                    await self._record(conn, migration)
+            else:
+                await self._apply_concurrently(conn, migration)
+        except Exception as e:
+            log.error(f"❌ Failed to apply {filename}: {e}")
+            raise MigrationError(f"Migration {migration.version} ({migration.name}) failed: {e}") from e
+        log.info(f"✅ Applied migration {migration.version} ({migration.name})")
+
+    async def _apply_concurrently(self, conn, migration: Migration):
+        """Each statement autocommits; a failed CONCURRENTLY build leaves an INVALID index behind,
+        which IF NOT EXISTS would then skip - drop those before (re)trying"""
+        await conn.execute(f"SET lock_timeout = '{self.lock_timeout}'")
+        try:
+            for index_name in _CONCURRENT_INDEX_NAME_RE.findall(_strip_comments(migration.sql)):
+                await self._drop_invalid_index(conn, index_name)
+            for statement in split_statements(migration.sql):
+                await conn.execute(statement)
+            await self._record(conn, migration)
+        finally:
+            await conn.execute("RESET lock_timeout")
+
+    async def _drop_invalid_index(self, conn, index_name: str):
+        invalid = await conn.fetchval("""
+            SELECT c.oid::regclass::text
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = $1 AND NOT i.indisvalid
+        """, index_name)
+        if invalid:
+            log.warning(f"Dropping invalid index {invalid} left by an interrupted build")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {invalid}")
+
+    async def _record(self, conn, migration: Migration):
+        await conn.execute(
+            "INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3)",
+            migration.version, migration.name, migration.checksum
+        )
@@ -1,4 +1,5 @@
 import re
+from typing import Optional
 
 def normalize_phone(phone: str) -> str:
     """
@@ -89,3 +90,11 @@ def get_phone_search_variants(phone: str) -> list[str]:
         variants.add(ten_digits)
     
     return list(variants)
+
+def to_e164(phone: str) -> Optional[str]:
+    """
+    normalize_phone() if the result is E.164 (+ and digits), else None.
+    Value for masters.phone_e164; bare-digit fallbacks are not stored there.
+    """
+    normalized = normalize_phone(phone)
+    return normalized if normalized.startswith('+') else None
@@ -0,0 +1,131 @@
+"""
+Per-query-shape statistics for Database._run.
+
+Queries are grouped by normalized SQL (whitespace collapsed, literals replaced
+by ?), so the same statement with different arguments is one shape.
+Statements run on a Database.connection() (transactions) are counted too,
+via InstrumentedConnection.
+"""
+
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, List
+
+log = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+
+# Dynamically built SQL must not grow the table without bound
+MAX_SHAPES = 1000
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(query: str) -> str:
+    sql = _STRING_RE.sub("?", query)
+    sql = _NUMBER_RE.sub("?", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def redact_args(args) -> List[str]:
+    """Argument types/sizes only - values may contain phones and names"""
+    redacted = []
+    for arg in args:
+        if arg is None:
+            redacted.append("NULL")
+        elif isinstance(arg, (str, bytes, list, tuple)):
+            redacted.append(f"<{type(arg).__name__}:{len(arg)}>")
+        else:
+            redacted.append(f"<{type(arg).__name__}>")
+    return redacted
+
+
+def count_rows(method: str, result) -> int:
+    if method == "fetch":
+        return len(result)
+    if method == "execute":
+        # Command tag, e.g. "UPDATE 3" / "INSERT 0 1"
+        tail = result.rsplit(" ", 1)[-1] if isinstance(result, str) else ""
+        return int(tail) if tail.isdigit() else 0
+    return 0 if result is None else 1
+
+
+class QueryStats:
+    def __init__(self, slow_query_ms: float = 200.0):
+        self.slow_query_ms = slow_query_ms
+        # normalized sql -> {calls, errors, total_ms, max_ms, rows}
+        self.shapes: Dict[str, dict] = {}
+        self.memo_hits = 0
+        self.slow_queries = 0
+        # Queries per update (request scope)
+        self.updates = 0
+        self.update_queries_total = 0
+        self.update_queries_max = 0
+
+    def record(self, method: str, query: str, args: tuple, elapsed: float, result=None, error: bool = False):
+        sql = normalize_sql(query)
+        elapsed_ms = elapsed * 1000
+        shape = self.shapes.get(sql)
+        if shape is None:
+            if len(self.shapes) >= MAX_SHAPES:
+                sql = "<other>"
+                shape = self.shapes.get(sql)
+        if shape is None:
+            shape = self.shapes[sql] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+        shape["calls"] += 1
+        shape["total_ms"] += elapsed_ms
+        if elapsed_ms > shape["max_ms"]:
+            shape["max_ms"] = elapsed_ms
+        if error:
+            shape["errors"] += 1
+        else:
+            shape["rows"] += count_rows(method, result)
+
+        if elapsed_ms >= self.slow_query_ms:
+            self.slow_queries += 1
+            log.warning(f"🐢 Slow query {elapsed_ms:.1f} ms: {sql[:500]} args={redact_args(args)}")
+
+    def record_update(self, queries: int):
+        self.updates += 1
+        self.update_queries_total += queries
+        if queries > self.update_queries_max:
+            self.update_queries_max = queries
+
+    def top(self, limit: int = 20, sort: str = "total_ms") -> List[dict]:
+        rows = []
+        for sql, shape in self.shapes.items():
+            calls = shape["calls"]
+            rows.append({
+                "sql": sql,
+                "calls": calls,
+                "errors": shape["errors"],
+                "total_ms": round(shape["total_ms"], 2),
+                "avg_ms": round(shape["total_ms"] / calls, 3) if calls else 0.0,
+                "max_ms": round(shape["max_ms"], 2),
+                "rows": shape["rows"],
+                "avg_rows": round(shape["rows"] / calls, 2) if calls else 0.0,
+            })
+        rows.sort(key=lambda r: r.get(sort, 0), reverse=True)
+        return rows[:limit]
+
+    def summary(self) -> dict:
+        return {
+            "shapes": len(self.shapes),
+            "calls": sum(s["calls"] for s in self.shapes.values()),
+            "memo_hits": self.memo_hits,
+            "slow_queries": self.slow_queries,
+            "slow_query_ms": self.slow_query_ms,
+            "updates": self.updates,
+            "queries_per_update": round(self.update_queries_total / self.updates, 2) if self.updates else 0.0,
+            "max_queries_per_update": self.update_queries_max,
+        }
+
+    def reset(self):
+        self.shapes.clear()
+        self.memo_hits = 0
+        self.slow_queries = 0
+        self.updates = 0
+        self.update_queries_total = 0
+        self.update_queries_max = 0